@@ -1,117 +1,596 @@
 # Enhanced Flask Server for WellnessGrid with Multi-turn Chat Support
 # Supports PubMedBERT embeddings and BioMistral generation with chat history
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import requests
 import torch
-from transformers import AutoTokenizer, AutoModel, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import AutoTokenizer, AutoModel, AutoModelForCausalLM, BitsAndBytesConfig, StaticCache, TextIteratorStreamer
 import numpy as np
+import os
+import json
+import base64
+import copy
+import hashlib
 import logging
 import traceback
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson (C, NumPy-aware) when it is installed"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, datetime):
+            # Match orjson's ISO-8601 output rather than Flask's HTTP-date format
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # Global variables for models
 pubmedbert_model = None
 pubmedbert_tokenizer = None
+pubmedbert_device = torch.device('cpu')
 biomistral_model = None
 biomistral_tokenizer = None
 
+# Micro-batching for /embed: concurrent requests are coalesced into one forward pass
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT_MS = 8
+EMBED_RESULT_TIMEOUT = 30  # seconds a request waits for its batched forward pass
+embed_queue = queue.Queue()
+embed_worker = None
+
+# Pinned host buffers (CUDA only) that tokenized batches are staged in before an
+# async host-to-device copy on a dedicated stream; only the batching thread uses them
+EMBED_MAX_TOKENS = 512
+embed_input_ids_pin = None
+embed_attention_pin = None
+embed_copy_stream = None
+
+# Character budgets applied before tokenization so oversized payloads cannot make the
+# tokenizer scan megabytes of text (512 BERT tokens fit comfortably in 4096 chars)
+EMBED_MAX_CHARS = 4096
+CONTEXT_MAX_CHARS = 6000
+HISTORY_MESSAGE_MAX_CHARS = 1000
+
+# LRU cache of embeddings keyed by blake2b digest of the text; hits skip the model
+EMBED_CACHE_SIZE = 10000
+embed_cache = OrderedDict()
+embed_cache_lock = threading.Lock()
+
+# BioMistral decode is compiled with a static KV cache; prompts are left-padded
+# to a fixed set of lengths so only a handful of graphs are ever captured
+BIOMISTRAL_COMPILE = os.environ.get('BIOMISTRAL_COMPILE', '1') == '1'
+PROMPT_BUCKETS = (256, 512, 1024, 2048)
+# The static KV cache always has this one length, so max_tokens and the prompt
+# bucket never change the compiled shapes; compiled requests are capped to it
+MAX_NEW_TOKENS = int(os.environ.get('BIOMISTRAL_MAX_NEW_TOKENS', '512'))
+STATIC_CACHE_LEN = PROMPT_BUCKETS[-1] + MAX_NEW_TOKENS
+biomistral_compiled = False
+
+# Quantization backend for BioMistral: awq / gptq use fused int4 GEMM kernels,
+# bnb (NF4) dequantizes per element and is kept as a fallback
+QUANT_BACKEND = os.environ.get('QUANT_BACKEND', 'awq').lower()
+QUANTIZED_MODELS = {
+    'awq': os.environ.get('BIOMISTRAL_AWQ_MODEL', 'BioMistral/BioMistral-7B-AWQ-QGS128-W4-GEMM'),
+    'gptq': os.environ.get('BIOMISTRAL_GPTQ_MODEL', 'TheBloke/BioMistral-7B-GPTQ'),
+}
+QUANT_PACKAGES = {'awq': 'awq', 'gptq': 'auto_gptq'}
+biomistral_quant_backend = None
+
+# Optional vLLM backend: when set, /generate is forwarded to a vLLM OpenAI-compatible
+# server (continuous batching + PagedAttention) and BioMistral is not loaded here, e.g.
+#   vllm serve BioMistral/BioMistral-7B-AWQ-QGS128-W4-GEMM --quantization awq --max-model-len 4096 --enable-prefix-caching
+VLLM_BASE_URL = os.environ.get('VLLM_BASE_URL', '').rstrip('/')
+VLLM_MODEL = os.environ.get('VLLM_MODEL', QUANTIZED_MODELS['awq'])
+vllm_session = requests.Session()
+
+# Fixed opening of every BioMistral prompt; its KV cache is computed once at load
+# time so each request only prefills the history/query/context that follows it
+BIOMISTRAL_PREAMBLE = "You are a medical AI assistant providing evidence-based information. Use the provided medical context to answer the user's question accurately and helpfully.\n\n"
+BIOMISTRAL_INSTRUCTIONS = """
+
+Instructions:
+- Provide accurate, evidence-based medical information
+- Reference the provided context when relevant
+- Consider the conversation history for continuity
+- Be thorough but concise
+- Include appropriate medical disclaimers
+- If the query relates to previous discussion, acknowledge that context
+
+Response:"""
+preamble_input_ids = None
+preamble_kv_cache = None
+
+# Serializes model loading; request handlers only read the globals
+model_load_lock = threading.Lock()
+
+# Bounds concurrent in-process generate() calls (each holds its own KV cache in GPU
+# memory); /embed needs no lock because only the batching thread runs PubMedBERT
+GENERATE_MAX_CONCURRENT = int(os.environ.get('GENERATE_MAX_CONCURRENT', '1'))
+generation_semaphore = threading.Semaphore(GENERATE_MAX_CONCURRENT)
+
 def load_pubmedbert():
     """Load PubMedBERT model for embeddings"""
-    global pubmedbert_model, pubmedbert_tokenizer
+    global pubmedbert_model, pubmedbert_tokenizer, pubmedbert_device, embed_worker
+    global embed_input_ids_pin, embed_attention_pin, embed_copy_stream
     try:
         logger.info("Loading PubMedBERT model...")
         model_name = "NeuML/pubmedbert-base-embeddings"
+        
+        # fp16 on GPU when available; fp32 on CPU where half precision is slow
+        if torch.cuda.is_available():
+            pubmedbert_device = torch.device('cuda')
+            dtype = torch.float16
+        else:
+            pubmedbert_device = torch.device('cpu')
+            dtype = torch.float32
+        
         pubmedbert_tokenizer = AutoTokenizer.from_pretrained(model_name)
-        pubmedbert_model = AutoModel.from_pretrained(model_name)
-        pubmedbert_model.eval()
+        pubmedbert_model = load_pubmedbert_weights(model_name, dtype)
+        pubmedbert_model.to(pubmedbert_device).eval()
+        logger.info(f"📍 PubMedBERT running on {pubmedbert_device} ({dtype})")
+        
+        if pubmedbert_device.type == 'cuda':
+            embed_input_ids_pin = torch.empty((EMBED_MAX_BATCH, EMBED_MAX_TOKENS), dtype=torch.long, pin_memory=True)
+            embed_attention_pin = torch.empty((EMBED_MAX_BATCH, EMBED_MAX_TOKENS), dtype=torch.long, pin_memory=True)
+            embed_copy_stream = torch.cuda.Stream()
+        
+        # Start the background batching thread once the model is ready
+        if embed_worker is None:
+            embed_worker = threading.Thread(target=embed_batch_worker, name="embed-batcher", daemon=True)
+            embed_worker.start()
+        
         logger.info("✅ PubMedBERT model loaded successfully")
     except Exception as e:
         logger.error(f"❌ Error loading PubMedBERT: {str(e)}")
         raise
 
+def load_pubmedbert_weights(model_name, dtype):
+    """Load PubMedBERT with fused scaled_dot_product_attention (BetterTransformer on older transformers)"""
+    try:
+        return AutoModel.from_pretrained(model_name, torch_dtype=dtype, attn_implementation="sdpa")
+    except (TypeError, ValueError) as e:
+        logger.warning(f"⚠️ SDPA attention not supported by this transformers version: {str(e)}")
+    
+    model = AutoModel.from_pretrained(model_name, torch_dtype=dtype)
+    try:
+        from optimum.bettertransformer import BetterTransformer
+        model = BetterTransformer.transform(model)
+        logger.info("✅ PubMedBERT converted with BetterTransformer")
+    except ImportError:
+        logger.warning("⚠️ optimum not installed; PubMedBERT uses eager attention")
+    return model
+
+def embed_texts(texts):
+    """Run a single padded PubMedBERT forward pass over a list of texts"""
+    model, tokenizer = pubmedbert_model, pubmedbert_tokenizer
+    inputs = tokenizer(texts, return_tensors='pt', padding=True, truncation=True, max_length=EMBED_MAX_TOKENS)
+    if embed_copy_stream is not None and len(texts) <= EMBED_MAX_BATCH:
+        inputs = stage_inputs_on_device(inputs)
+    else:
+        inputs = {k: v.to(pubmedbert_device) for k, v in inputs.items()}
+    
+    with torch.inference_mode():
+        outputs = model(**inputs)
+        hidden = outputs.last_hidden_state
+        # Masked mean pooling as one fused contraction (padding contributes nothing)
+        mask = inputs['attention_mask'].to(hidden.dtype)
+        pooled = torch.einsum('bld,bl->bd', hidden, mask) / mask.sum(dim=1, keepdim=True).clamp(min=1)
+        # Unit length, so cosine similarity downstream is a plain dot product
+        embeddings = torch.nn.functional.normalize(pooled.float(), dim=-1)
+    
+    # Back to fp32 on the host so JSON output keeps full precision
+    return embeddings.float().cpu().numpy()
+
+def stage_inputs_on_device(inputs):
+    """Copy a tokenized batch through the pinned buffers with a non-blocking transfer"""
+    n, length = inputs['input_ids'].shape
+    # Contiguous views over the front of each buffer: a [:n, :length] slice is strided and
+    # .to() would route it through a pageable temporary instead of a direct async copy
+    input_ids_pin = embed_input_ids_pin.view(-1)[:n * length].view(n, length)
+    attention_pin = embed_attention_pin.view(-1)[:n * length].view(n, length)
+    input_ids_pin.copy_(inputs['input_ids'])
+    attention_pin.copy_(inputs['attention_mask'])
+    
+    with torch.cuda.stream(embed_copy_stream):
+        input_ids = input_ids_pin.to(pubmedbert_device, non_blocking=True)
+        attention_mask = attention_pin.to(pubmedbert_device, non_blocking=True)
+    
+    # Compute must not start before the copy lands; the pinned buffers are safe to
+    # reuse once embed_texts has synchronized on the .cpu() of its result
+    torch.cuda.current_stream().wait_stream(embed_copy_stream)
+    input_ids.record_stream(torch.cuda.current_stream())
+    attention_mask.record_stream(torch.cuda.current_stream())
+    return {'input_ids': input_ids, 'attention_mask': attention_mask}
+
+def truncate_text(text, max_chars, label):
+    """Cap text at max_chars, logging when a request is truncated"""
+    if len(text) <= max_chars:
+        return text
+    logger.warning(f"⚠️ Truncating {label} from {len(text)} to {max_chars} characters")
+    return text[:max_chars]
+
+def get_embedding(text):
+    """Return the embedding for text, using the LRU cache before queueing a forward pass"""
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    
+    with embed_cache_lock:
+        embedding = embed_cache.get(key)
+        if embedding is not None:
+            embed_cache.move_to_end(key)
+            return embedding
+    
+    # Nothing drains the queue until load_pubmedbert has started the batching thread
+    if pubmedbert_model is None or embed_worker is None:
+        raise RuntimeError("PubMedBERT model is not loaded")
+    
+    # Hand the text to the batching thread and wait for its embedding
+    future = Future()
+    embed_queue.put((text, future))
+    embedding = future.result(timeout=EMBED_RESULT_TIMEOUT)
+    embedding.setflags(write=False)
+    
+    with embed_cache_lock:
+        embed_cache[key] = embedding
+        if len(embed_cache) > EMBED_CACHE_SIZE:
+            embed_cache.popitem(last=False)
+    
+    return embedding
+
+def embed_batch_worker():
+    """Drain queued /embed requests and answer them with one batched forward pass"""
+    while True:
+        batch = [embed_queue.get()]
+        deadline = time.monotonic() + EMBED_MAX_WAIT_MS / 1000
+        
+        while len(batch) < EMBED_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(embed_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            embeddings = embed_texts([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                # Copy each row so cached vectors do not pin the whole batch array
+                future.set_result(embedding.copy())
+        except Exception as e:
+            logger.error(f"❌ Error in embed batch of {len(batch)}: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+
 def load_biomistral():
     """Load BioMistral model for generation"""
-    global biomistral_model, biomistral_tokenizer
+    global biomistral_model, biomistral_tokenizer, biomistral_quant_backend
     try:
         logger.info("Loading BioMistral model...")
         model_name = "BioMistral/BioMistral-7B"
+        backend = biomistral_quant_backend = resolve_quant_backend()
         
-        # Configure quantization for memory efficiency
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_compute_dtype=torch.float16,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_quant_type="nf4"
-        )
+        model_kwargs = {'device_map': "auto", 'torch_dtype': torch.float16}
+        if backend in QUANTIZED_MODELS:
+            # Pre-quantized checkpoint; the quantization config ships with the weights
+            model_name = QUANTIZED_MODELS[backend]
+        elif backend == 'bnb':
+            logger.warning("⚠️ Using bitsandbytes NF4; decode is slower than AWQ/GPTQ int4 kernels")
+            model_kwargs['quantization_config'] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.float16,
+                bnb_4bit_use_double_quant=True,
+                bnb_4bit_quant_type="nf4"
+            )
         
+        logger.info(f"📦 BioMistral checkpoint: {model_name} (quantization: {backend})")
         biomistral_tokenizer = AutoTokenizer.from_pretrained(model_name)
-        biomistral_model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            quantization_config=quantization_config,
-            device_map="auto",
-            torch_dtype=torch.float16
-        )
+        biomistral_model = AutoModelForCausalLM.from_pretrained(model_name, **model_kwargs)
         
         # Set pad token
         if biomistral_tokenizer.pad_token is None:
             biomistral_tokenizer.pad_token = biomistral_tokenizer.eos_token
+        
+        if BIOMISTRAL_COMPILE and torch.cuda.is_available():
+            compile_biomistral()
+        if not biomistral_compiled:
+            # The compiled path uses a static cache, which cannot be seeded with a prefix
+            build_preamble_cache()
             
         logger.info("✅ BioMistral model loaded successfully")
     except Exception as e:
         logger.error(f"❌ Error loading BioMistral: {str(e)}")
         raise
 
+def resolve_quant_backend():
+    """Pick the configured quantization backend, falling back to bnb if its kernels are missing"""
+    backend = QUANT_BACKEND
+    if backend not in ('awq', 'gptq', 'bnb', 'fp16'):
+        logger.warning(f"⚠️ Unknown QUANT_BACKEND '{backend}', using bnb")
+        return 'bnb'
+    
+    if backend in QUANT_PACKAGES:
+        try:
+            __import__(QUANT_PACKAGES[backend])
+        except ImportError:
+            logger.warning(f"⚠️ {backend} kernels not installed (pip install {'autoawq' if backend == 'awq' else 'auto-gptq optimum'}), using bnb")
+            return 'bnb'
+    
+    return backend
+
+def compile_biomistral():
+    """Compile the BioMistral forward pass and warm it up on every prompt bucket"""
+    global biomistral_compiled
+    eager_forward = biomistral_model.forward
+    try:
+        logger.info("⚙️ Compiling BioMistral forward pass (reduce-overhead)...")
+        biomistral_model.forward = torch.compile(
+            biomistral_model.forward,
+            mode="reduce-overhead",
+            fullgraph=True,
+            dynamic=False
+        )
+        biomistral_compiled = True
+        
+        # Warm-compile every bucket so no real request pays for graph capture
+        warmup = biomistral_tokenizer("Warm up", return_tensors='pt')
+        for bucket in PROMPT_BUCKETS:
+            input_ids, attention_mask = pad_to_bucket(warmup['input_ids'], warmup['attention_mask'], bucket)
+            with torch.no_grad():
+                biomistral_model.generate(
+                    input_ids.to(biomistral_model.device),
+                    attention_mask=attention_mask.to(biomistral_model.device),
+                    max_new_tokens=2,
+                    do_sample=False,
+                    pad_token_id=biomistral_tokenizer.eos_token_id,
+                    past_key_values=new_static_cache()
+                )
+        logger.info("✅ BioMistral compiled and warmed up")
+    except Exception as e:
+        # Compilation is an optimization only; fall back to eager generate
+        logger.warning(f"⚠️ torch.compile unavailable for BioMistral, using eager mode: {str(e)}")
+        biomistral_model.forward = eager_forward
+        biomistral_compiled = False
+
+def build_preamble_cache():
+    """Run prefill over BIOMISTRAL_PREAMBLE once and keep its past_key_values"""
+    global preamble_input_ids, preamble_kv_cache
+    try:
+        preamble_ids = biomistral_tokenizer(BIOMISTRAL_PREAMBLE, return_tensors='pt')['input_ids']
+        with torch.no_grad():
+            outputs = biomistral_model(preamble_ids.to(biomistral_model.device), use_cache=True)
+        preamble_input_ids = preamble_ids[0]
+        preamble_kv_cache = outputs.past_key_values
+        logger.info(f"✅ Cached preamble KV for {preamble_ids.shape[1]} prompt tokens")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not precompute preamble KV cache: {str(e)}")
+        preamble_input_ids = None
+        preamble_kv_cache = None
+
+def new_static_cache():
+    """Allocate a BioMistral KV cache of the fixed STATIC_CACHE_LEN used by the compiled graphs"""
+    return StaticCache(
+        config=biomistral_model.config,
+        max_batch_size=1,
+        max_cache_len=STATIC_CACHE_LEN,
+        device=biomistral_model.device,
+        dtype=biomistral_model.dtype
+    )
+
+def pad_to_bucket(input_ids, attention_mask, bucket=None):
+    """Left-pad a tokenized prompt up to the nearest PROMPT_BUCKETS length (or the given one)"""
+    length = input_ids.shape[1]
+    if bucket is None:
+        bucket = next((b for b in PROMPT_BUCKETS if length <= b), length)
+    pad = bucket - length
+    if pad == 0:
+        return input_ids, attention_mask
+    
+    input_ids = torch.nn.functional.pad(input_ids, (pad, 0), value=biomistral_tokenizer.pad_token_id)
+    attention_mask = torch.nn.functional.pad(attention_mask, (pad, 0), value=0)
+    return input_ids, attention_mask
+
+def load_models():
+    """Load every model this server needs exactly once (dev server or gunicorn worker)"""
+    with model_load_lock:
+        if pubmedbert_model is None:
+            load_pubmedbert()
+        if VLLM_BASE_URL:
+            logger.info(f"🔀 Forwarding generation to vLLM at {VLLM_BASE_URL}")
+        elif biomistral_model is None:
+            load_biomistral()
+
 def format_chat_history_for_prompt(history_list):
     """Format chat history for BioMistral prompt"""
     if not history_list:
         return ""
     
-    formatted_history = []
-    for msg in history_list:
-        role = msg.get('role', 'user')
-        content = msg.get('content', '')
-        role_label = 'User' if role == 'user' else 'Assistant'
-        formatted_history.append(f"{role_label}: {content}")
-    
-    return '\n'.join(formatted_history) + '\n'
+    return '\n'.join(
+        f"{'User' if msg.get('role', 'user') == 'user' else 'Assistant'}: {msg.get('content', '')}"
+        for msg in history_list
+    ) + '\n'
 
 def create_biomistral_prompt(query, context, history_list=None):
     """Create a comprehensive prompt for BioMistral with chat history"""
     
     # Format chat history if provided
-    history_str = ""
-    if history_list:
-        history_str = format_chat_history_for_prompt(history_list)
-        if history_str:
-            history_str = f"Previous conversation:\n{history_str}\n"
+    history_str = format_chat_history_for_prompt(history_list)
     
-    # Create the full prompt
-    prompt = f"""You are a medical AI assistant providing evidence-based information. Use the provided medical context to answer the user's question accurately and helpfully.
+    # Assemble the full prompt in one join around the constant preamble/instructions
+    return ''.join((
+        BIOMISTRAL_PREAMBLE,
+        "Previous conversation:\n" if history_str else "",
+        history_str,
+        "\n" if history_str else "",
+        "Current query: ",
+        query,
+        "\n\nRelevant Medical Information:\n",
+        context,
+        BIOMISTRAL_INSTRUCTIONS
+    ))
 
-{history_str}Current query: {query}
+def build_generate_kwargs(prompt, max_tokens, temperature):
+    """Tokenize a prompt and assemble the keyword arguments for biomistral_model.generate"""
+    model, tokenizer = biomistral_model, biomistral_tokenizer
+    
+    # Tokenize prompt
+    inputs = tokenizer(
+        prompt, 
+        return_tensors='pt', 
+        padding=True, 
+        truncation=True, 
+        max_length=PROMPT_BUCKETS[-1]
+    )
+    input_ids, attention_mask = inputs['input_ids'], inputs['attention_mask']
+    
+    generate_kwargs = {}
+    if biomistral_compiled:
+        # Fixed shapes let the compiled decode step replay captured CUDA graphs
+        input_ids, attention_mask = pad_to_bucket(input_ids, attention_mask)
+        generate_kwargs['past_key_values'] = new_static_cache()
+        max_tokens = min(max_tokens, MAX_NEW_TOKENS)
+    elif preamble_kv_cache is not None:
+        # Reuse the preamble's KV so prefill starts after it; the copy keeps the
+        # shared cache pristine since generate appends to it in place
+        prefix_len = preamble_input_ids.shape[0]
+        if input_ids.shape[1] > prefix_len and torch.equal(input_ids[0, :prefix_len], preamble_input_ids):
+            generate_kwargs['past_key_values'] = copy.deepcopy(preamble_kv_cache)
+    
+    generate_kwargs.update(
+        input_ids=input_ids.to(model.device),
+        attention_mask=attention_mask.to(model.device),
+        max_new_tokens=max_tokens,
+        temperature=temperature,
+        do_sample=True,
+        pad_token_id=tokenizer.eos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        repetition_penalty=1.1
+    )
+    return generate_kwargs
 
-Relevant Medical Information:
-{context}
+def generate_with_transformers(prompt, max_tokens, temperature):
+    """Generate a completion with the in-process BioMistral model"""
+    model, tokenizer = biomistral_model, biomistral_tokenizer
+    generate_kwargs = build_generate_kwargs(prompt, max_tokens, temperature)
+    
+    # Generate response
+    with generation_semaphore, torch.no_grad():
+        outputs = model.generate(**generate_kwargs)
+    
+    # Decode only the generated tokens (everything after the prompt)
+    prompt_len = generate_kwargs['input_ids'].shape[1]
+    return tokenizer.decode(outputs[0, prompt_len:], skip_special_tokens=True).strip()
 
-Instructions:
-- Provide accurate, evidence-based medical information
-- Reference the provided context when relevant
-- Consider the conversation history for continuity
-- Be thorough but concise
-- Include appropriate medical disclaimers
-- If the query relates to previous discussion, acknowledge that context
+def generate_with_vllm(prompt, max_tokens, temperature):
+    """Generate a completion through the vLLM OpenAI-compatible completions API"""
+    response = vllm_session.post(
+        f"{VLLM_BASE_URL}/v1/completions",
+        json={
+            'model': VLLM_MODEL,
+            'prompt': prompt,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'repetition_penalty': 1.1
+        },
+        timeout=300
+    )
+    response.raise_for_status()
+    return response.json()['choices'][0]['text'].strip()
 
-Response:"""
+def stream_with_transformers(prompt, max_tokens, temperature):
+    """Yield decoded text pieces from the in-process BioMistral model as they are generated"""
+    model = biomistral_model
+    streamer = TextIteratorStreamer(biomistral_tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generate_kwargs = build_generate_kwargs(prompt, max_tokens, temperature)
+    generate_kwargs['streamer'] = streamer
+    
+    errors = []
     
-    return prompt
+    def run_generate():
+        try:
+            with generation_semaphore, torch.no_grad():
+                model.generate(**generate_kwargs)
+        except Exception as e:
+            # Without the end-of-stream signal the consumer below would wait on the streamer forever
+            errors.append(e)
+            streamer.end()
+    
+    threading.Thread(target=run_generate, daemon=True).start()
+    for text in streamer:
+        if text:
+            yield text
+    if errors:
+        raise errors[0]
+
+def stream_with_vllm(prompt, max_tokens, temperature):
+    """Yield text pieces from the vLLM completions API using its SSE stream"""
+    with vllm_session.post(
+        f"{VLLM_BASE_URL}/v1/completions",
+        json={
+            'model': VLLM_MODEL,
+            'prompt': prompt,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'repetition_penalty': 1.1,
+            'stream': True
+        },
+        stream=True,
+        timeout=300
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data: '):
+                continue
+            payload = line[len('data: '):]
+            if payload == '[DONE]':
+                break
+            text = json.loads(payload)['choices'][0]['text']
+            if text:
+                yield text
+
+def sse_token_stream(tokens, history_messages):
+    """Wrap a token generator as Server-Sent Events frames"""
+    response_length = 0
+    try:
+        for text in tokens:
+            response_length += len(text)
+            yield f"data: {json.dumps({'token': text})}\n\n"
+        yield f"data: {json.dumps({'done': True, 'response_length': response_length, 'history_messages': history_messages})}\n\n"
+    except Exception as e:
+        logger.error(f"❌ Error while streaming response: {str(e)}")
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
 @app.route('/embed', methods=['POST'])
 def embed_text():
@@ -123,22 +602,27 @@ def embed_text():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
         
+        text = truncate_text(text, EMBED_MAX_CHARS, 'embed text')
         logger.info(f"🔍 Generating embedding for text: {text[:100]}...")
         
-        # Tokenize and get embeddings
-        inputs = pubmedbert_tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=512)
+        embedding = get_embedding(text)
+        dimensions = embedding.shape[-1]
         
-        with torch.no_grad():
-            outputs = pubmedbert_model(**inputs)
-            # Use mean pooling of last hidden states
-            embeddings = outputs.last_hidden_state.mean(dim=1)
-            embedding_list = embeddings.squeeze().numpy().tolist()
+        logger.info(f"✅ Generated embedding with {dimensions} dimensions")
         
-        logger.info(f"✅ Generated embedding with {len(embedding_list)} dimensions")
+        # Compact binary form: little-endian float16 bytes, base64-encoded (~2 KB vs ~10 KB of JSON)
+        if request.args.get('format', data.get('format', 'json')) == 'f16':
+            return jsonify({
+                'embedding_b64': base64.b64encode(embedding.astype('<f2').tobytes()).decode('ascii'),
+                'dtype': 'float16',
+                'dimensions': dimensions,
+                'model': 'NeuML/pubmedbert-base-embeddings'
+            })
         
+        # The ndarray is serialized directly by the JSON provider
         return jsonify({
-            'embedding': embedding_list,
-            'dimensions': len(embedding_list),
+            'embedding': embedding,
+            'dimensions': dimensions,
             'model': 'NeuML/pubmedbert-base-embeddings'
         })
         
@@ -157,6 +641,7 @@ def generate_response():
         history = data.get('history', [])  # New: chat history
         max_tokens = data.get('max_tokens', 200)
         temperature = data.get('temperature', 0.7)
+        stream = data.get('stream', False)
         
         if not query:
             return jsonify({'error': 'No query provided'}), 400
@@ -165,44 +650,35 @@ def generate_response():
         logger.info(f"📚 Context length: {len(context)} characters")
         logger.info(f"💬 Chat history: {len(history)} messages")
         
+        context = truncate_text(context, CONTEXT_MAX_CHARS, 'context')
+        history = [
+            {**msg, 'content': truncate_text(msg.get('content', ''), HISTORY_MESSAGE_MAX_CHARS, 'history message')}
+            for msg in history
+        ]
+        
         # Create prompt with chat history
         prompt = create_biomistral_prompt(query, context, history)
         
         logger.info(f"📝 Generated prompt length: {len(prompt)} characters")
         
-        # Tokenize prompt
-        inputs = biomistral_tokenizer(
-            prompt, 
-            return_tensors='pt', 
-            padding=True, 
-            truncation=True, 
-            max_length=2048
-        )
-        
-        # Generate response
-        with torch.no_grad():
-            outputs = biomistral_model.generate(
-                inputs['input_ids'],
-                attention_mask=inputs['attention_mask'],
-                max_new_tokens=max_tokens,
-                temperature=temperature,
-                do_sample=True,
-                pad_token_id=biomistral_tokenizer.eos_token_id,
-                eos_token_id=biomistral_tokenizer.eos_token_id,
-                repetition_penalty=1.1
+        if stream:
+            # Send tokens as they are decoded instead of waiting for the full answer
+            streamer = stream_with_vllm if VLLM_BASE_URL else stream_with_transformers
+            tokens = streamer(prompt, max_tokens, temperature)
+            return Response(
+                stream_with_context(sse_token_stream(tokens, len(history))),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
             )
         
-        # Decode response
-        response = biomistral_tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract only the generated part (after the prompt)
-        answer = response[len(prompt):].strip()
-        
-        # Clean up the answer
-        if answer.startswith("Response:"):
-            answer = answer[9:].strip()
+        start_ns = time.perf_counter_ns()
+        if VLLM_BASE_URL:
+            answer = generate_with_vllm(prompt, max_tokens, temperature)
+        else:
+            answer = generate_with_transformers(prompt, max_tokens, temperature)
+        generation_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
         
-        logger.info(f"✅ Generated response length: {len(answer)} characters")
+        logger.info("✅ Generated response length: %d characters in %d ms", len(answer), generation_ms)
         
         return jsonify({
             'answer': answer,
@@ -210,7 +686,8 @@ def generate_response():
             'prompt_length': len(prompt),
             'response_length': len(answer),
             'history_messages': len(history),
-            'timestamp': datetime.now().isoformat()
+            'generation_ms': generation_ms,
+            'timestamp': datetime.now()
         })
         
     except Exception as e:
@@ -224,7 +701,7 @@ def health_check():
     try:
         models_loaded = {
             'pubmedbert': pubmedbert_model is not None,
-            'biomistral': biomistral_model is not None
+            'biomistral': biomistral_model is not None or bool(VLLM_BASE_URL)
         }
         
         return jsonify({
@@ -234,9 +711,10 @@ def health_check():
                 'embeddings': models_loaded['pubmedbert'],
                 'generation': models_loaded['biomistral'],
                 'chat_history': True,
-                'multi_turn': True
+                'multi_turn': True,
+                'streaming': True
             },
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now()
         })
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
@@ -266,16 +744,20 @@ def status():
                 'biomistral_generation': True,
                 'chat_history_support': True,
                 'multi_turn_conversations': True,
-                'quantized_models': True
+                'quantized_models': True,
+                'compiled_generation': biomistral_compiled,
+                'quantization_backend': biomistral_quant_backend
             },
             'models': {
                 'embedding_model': 'NeuML/pubmedbert-base-embeddings',
                 'generation_model': 'BioMistral/BioMistral-7B',
                 'pubmedbert_loaded': pubmedbert_model is not None,
-                'biomistral_loaded': biomistral_model is not None
+                'embedding_cache_entries': len(embed_cache),
+                'biomistral_loaded': biomistral_model is not None,
+                'generation_backend': 'vllm' if VLLM_BASE_URL else 'transformers'
             },
             'device_info': device_info,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -285,16 +767,16 @@ if __name__ == '__main__':
         logger.info("🚀 Starting WellnessGrid Enhanced Flask Server...")
         
         # Load models
-        load_pubmedbert()
-        load_biomistral()
+        load_models()
         
         logger.info("🎉 All models loaded successfully!")
         logger.info("🌐 Server starting on http://localhost:5001")
         logger.info("📋 Available endpoints:")
-        logger.info("  - POST /embed - Generate PubMedBERT embeddings")
-        logger.info("  - POST /generate - Generate BioMistral responses with chat history")
+        logger.info("  - POST /embed - Generate PubMedBERT embeddings (?format=f16 for base64 float16)")
+        logger.info("  - POST /generate - Generate BioMistral responses with chat history (\"stream\": true for SSE)")
         logger.info("  - GET /health - Health check")
         logger.info("  - GET /status - Detailed status")
+        logger.info("💡 For concurrent traffic run: gunicorn -c gunicorn_conf.py enhanced_flask_server:app")
         
         app.run(host='0.0.0.0', port=5001, debug=False)
         
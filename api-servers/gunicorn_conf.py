@@ -0,0 +1,40 @@
+# Gunicorn configuration for the WellnessGrid Enhanced Flask Server
+# Usage: gunicorn -c gunicorn_conf.py enhanced_flask_server:app
+#
+# A single worker process keeps one copy of the models in (GPU) memory, while
+# many threads let tokenization, JSON encoding and network I/O overlap with
+# model compute and feed the /embed batching queue.
+#
+# Models are not preloaded in the master: CUDA state does not survive fork().
+
+import threading
+
+bind = "0.0.0.0:5001"
+workers = 1
+worker_class = "gthread"
+threads = 32
+timeout = 300
+keepalive = 5
+
+# A cold start (weights download, quantized load, torch.compile of every prompt
+# bucket) can outlast `timeout`; the worker heartbeats while loading, up to this long
+boot_timeout = 1800
+
+def post_worker_init(worker):
+    """Load models once the worker process has started, heartbeating so the arbiter does not kill it"""
+    from enhanced_flask_server import load_models
+    
+    loaded = threading.Event()
+    
+    def heartbeat():
+        # Stops after boot_timeout so a load that is truly stuck is still killed
+        for _ in range(int(boot_timeout // 10)):
+            if loaded.wait(10):
+                return
+            worker.notify()
+    
+    threading.Thread(target=heartbeat, name="boot-heartbeat", daemon=True).start()
+    try:
+        load_models()
+    finally:
+        loaded.set()
@@ -6,70 +6,349 @@ Provides PubMedBERT embeddings and BioGPT text generation locally
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import base64
 import os
+import re
 import sys
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import islice
 
 # Add error handling for missing packages
 try:
     from sentence_transformers import SentenceTransformer
     import torch
-    from transformers import BioGptTokenizer, BioGptForCausalLM
     import numpy as np
 except ImportError as e:
     print(f"❌ Missing package: {e}")
     print("📦 Install with: pip install sentence-transformers transformers torch flask flask-cors numpy")
     sys.exit(1)
 
+# Optional ONNX Runtime backend for embeddings (fused kernels, SIMD CPU paths)
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+except ImportError:
+    ort = None
+
 app = Flask(__name__)
 CORS(app)
 
+EMBEDDING_MODEL_NAME = 'NeuML/pubmedbert-base-embeddings'
+ONNX_MODEL_DIR = os.environ.get('PUBMEDBERT_ONNX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pubmedbert_onnx'))
+
 # Global model variables
 embedding_model = None
+onnx_session = None
+onnx_tokenizer = None
 biogpt_model = None
 biogpt_tokenizer = None
+biogpt_load_failed = False
+
+# Concurrent /embed requests are coalesced by a background thread into one encode call
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT_MS = 8
+EMBED_RESULT_TIMEOUT = 30  # seconds a request waits for its batched forward pass
+embed_queue = queue.Queue()
+embed_worker = None
+embed_stream = None
+# Server threads that arrive before the model is ready must not each load it
+embedding_model_lock = threading.Lock()
+
+# BioGPT prompt: the fixed opening is tokenized once at load time, and on CUDA the
+# forward pass is compiled with prompts left-padded to a few fixed lengths
+BIOGPT_MODEL_NAME = "microsoft/biogpt"
+BIOGPT_PROMPT_PREFIX = "You are a helpful and accurate medical assistant. Use the following context to answer the question.\n\nContext:\n"
+BIOGPT_QUESTION_MID = "\n\nQuestion: "
+BIOGPT_ANSWER_SUFFIX = "\n\nAnswer (based only on the context, no assumptions):"
+BIOGPT_PROMPT_BUCKETS = (64, 128, 192, 256)
+BIOGPT_MAX_NEW_TOKENS = 60
+# Context and question are tokenized separately within token budgets; text is cut to
+# BIOGPT_CHARS_PER_TOKEN characters per budgeted token first so BPE never sees the whole context
+BIOGPT_QUERY_BUDGET = 48
+BIOGPT_CHARS_PER_TOKEN = 8
+biogpt_device = 'cpu'
+biogpt_prefix_ids = None
+biogpt_mid_ids = None
+biogpt_suffix_ids = None
+biogpt_compiled = False
+biogpt_static_cache = False
+# One BioGPT generate at a time: the static KV cache and captured CUDA graphs belong to the
+# model, so concurrent requests from the server threads would overwrite each other's buffers
+biogpt_generate_lock = threading.Lock()
+
+def load_onnx_embedding_session():
+    """Create an ONNX Runtime session for PubMedBERT, exporting the model on first use"""
+    model_path = os.path.join(ONNX_MODEL_DIR, 'model.onnx')
+    if not os.path.exists(model_path):
+        print(f"📦 Exporting PubMedBERT to ONNX in {ONNX_MODEL_DIR} (one-time)...")
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        ORTModelForFeatureExtraction.from_pretrained(EMBEDDING_MODEL_NAME, export=True).save_pretrained(ONNX_MODEL_DIR)
+        AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME).save_pretrained(ONNX_MODEL_DIR)
+    
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = os.cpu_count() or 1
+    available = ort.get_available_providers()
+    providers = [p for p in ('CUDAExecutionProvider', 'CPUExecutionProvider') if p in available]
+    
+    session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+    tokenizer = AutoTokenizer.from_pretrained(ONNX_MODEL_DIR)
+    return session, tokenizer
 
 def load_embedding_model():
-    """Load PubMedBERT embedding model"""
-    global embedding_model
-    if embedding_model is None:
-        print("🧠 Loading PubMedBERT embedding model...")
+    """Load PubMedBERT embedding model (ONNX Runtime if available, else SentenceTransformer)"""
+    global embedding_model, onnx_session, onnx_tokenizer, embed_worker, embed_stream
+    with embedding_model_lock:
+        if embedding_model is None and onnx_session is None:
+            print("🧠 Loading PubMedBERT embedding model...")
+            if ort is not None:
+                try:
+                    onnx_session, onnx_tokenizer = load_onnx_embedding_session()
+                    print(f"✅ PubMedBERT loaded with ONNX Runtime ({onnx_session.get_providers()[0]})")
+                except Exception as e:
+                    print(f"⚠️ ONNX Runtime unavailable for PubMedBERT, using SentenceTransformer: {e}")
+            if onnx_session is None:
+                try:
+                    # GPU-resident fp16 weights when CUDA is available
+                    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+                    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+                    embedding_model.eval()
+                    if device == 'cuda':
+                        embedding_model.half()
+                        # Dedicated stream so batched encodes don't queue behind BioGPT kernels
+                        embed_stream = torch.cuda.Stream()
+                    print(f"✅ PubMedBERT loaded successfully ({device})")
+                except Exception as e:
+                    print(f"❌ Failed to load PubMedBERT: {e}")
+                    raise e
+        
+            # Initialize cuBLAS/cuDNN handles and kernels before the first real request
+            encode_texts(["warmup"])
+        if embed_worker is None:
+            embed_worker = threading.Thread(target=embed_batch_worker, name="embed-batcher", daemon=True)
+            embed_worker.start()
+        return onnx_session or embedding_model
+
+def encode_texts(texts):
+    """Embed a batch of texts in one call; returns unit-length float32 rows"""
+    if onnx_session is None:
+        stream = torch.cuda.stream(embed_stream) if embed_stream is not None else nullcontext()
+        with torch.inference_mode(), stream:
+            embeddings = embedding_model.encode(
+                texts,
+                batch_size=len(texts),
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        return embeddings.astype(np.float32, copy=False)
+    
+    inputs = onnx_tokenizer(texts, return_tensors='np', padding=True, truncation=True, max_length=512)
+    feed = {i.name: inputs[i.name].astype(np.int64) for i in onnx_session.get_inputs() if i.name in inputs}
+    hidden = onnx_session.run(None, feed)[0]
+    
+    # Mean pooling over real tokens, matching the SentenceTransformer pipeline
+    mask = inputs['attention_mask'][..., None].astype(hidden.dtype)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    return (pooled / np.linalg.norm(pooled, axis=1, keepdims=True)).astype(np.float32, copy=False)
+
+def embed_batch_worker():
+    """Drain queued /embed requests and answer them with a single batched encode"""
+    while True:
+        batch = [embed_queue.get()]
+        deadline = time.monotonic() + EMBED_MAX_WAIT_MS / 1000
+        
+        while len(batch) < EMBED_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(embed_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
         try:
-            embedding_model = SentenceTransformer('NeuML/pubmedbert-base-embeddings')
-            print("✅ PubMedBERT loaded successfully")
+            embeddings = encode_texts([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding.copy())
         except Exception as e:
-            print(f"❌ Failed to load PubMedBERT: {e}")
-            raise e
-    return embedding_model
+            print(f"❌ Embedding batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+
+def encode_text(text):
+    """Embed a single text via the batching thread"""
+    future = Future()
+    embed_queue.put((text, future))
+    return future.result(timeout=EMBED_RESULT_TIMEOUT)
 
 def load_biogpt_model():
     """Load BioGPT model for text generation"""
-    global biogpt_model, biogpt_tokenizer
-    if biogpt_model is None:
+    global biogpt_model, biogpt_tokenizer, biogpt_load_failed, biogpt_device, biogpt_prefix_ids, biogpt_mid_ids, biogpt_suffix_ids
+    if biogpt_model is None and not biogpt_load_failed:
         print("🤖 Loading BioGPT model...")
         try:
-            biogpt_tokenizer = BioGptTokenizer.from_pretrained("microsoft/biogpt")
-            biogpt_model = BioGptForCausalLM.from_pretrained("microsoft/biogpt")
-            print("✅ BioGPT loaded successfully")
+            # Imported here so the BioGPT classes are only pulled in when generation is used
+            from transformers import BioGptTokenizer, BioGptForCausalLM
+            biogpt_tokenizer = BioGptTokenizer.from_pretrained(BIOGPT_MODEL_NAME)
+            biogpt_model = BioGptForCausalLM.from_pretrained(BIOGPT_MODEL_NAME)
+            biogpt_model.eval()
+            biogpt_prefix_ids = torch.tensor(biogpt_tokenizer.encode(BIOGPT_PROMPT_PREFIX))
+            biogpt_mid_ids = biogpt_tokenizer.encode(BIOGPT_QUESTION_MID, add_special_tokens=False)
+            biogpt_suffix_ids = biogpt_tokenizer.encode(BIOGPT_ANSWER_SUFFIX, add_special_tokens=False)
+            
+            if torch.cuda.is_available():
+                biogpt_device = 'cuda'
+                biogpt_model.to(biogpt_device, dtype=torch.bfloat16)
+                compile_biogpt_model()
+            print(f"✅ BioGPT loaded successfully ({biogpt_device})")
         except Exception as e:
             print(f"❌ Failed to load BioGPT: {e}")
-            # Non-critical error - we can still do embeddings
-            pass
+            # Non-critical error - we can still do embeddings; don't retry on every request
+            biogpt_load_failed = True
     return biogpt_model, biogpt_tokenizer
 
+def compile_biogpt_model():
+    """Compile the BioGPT forward pass (CUDA graphs) and warm it up before serving"""
+    global biogpt_compiled, biogpt_static_cache
+    eager_forward = biogpt_model.forward
+    try:
+        print("⚙️ Compiling BioGPT forward pass (reduce-overhead)...")
+        biogpt_model.forward = torch.compile(eager_forward, mode="reduce-overhead")
+        biogpt_compiled = True
+        
+        # With a static KV cache every decode step of a bucket has identical shapes, so
+        # one CUDA graph per bucket is captured here and replayed for each token
+        biogpt_static_cache = True
+        try:
+            warm_up_biogpt_buckets()
+        except Exception as e:
+            print(f"⚠️ Static KV cache unsupported for BioGPT, using dynamic cache: {e}")
+            biogpt_static_cache = False
+            warm_up_biogpt_buckets()
+        print(f"✅ BioGPT compiled and warmed up for buckets {BIOGPT_PROMPT_BUCKETS}")
+    except Exception as e:
+        print(f"⚠️ torch.compile unavailable for BioGPT, using eager mode: {e}")
+        biogpt_model.forward = eager_forward
+        biogpt_compiled = False
+        biogpt_static_cache = False
+
+def warm_up_biogpt_buckets():
+    """Run dummy generations at every prompt bucket to trigger compilation and graph capture"""
+    for bucket in BIOGPT_PROMPT_BUCKETS:
+        pad = bucket - biogpt_prefix_ids.shape[0]
+        input_ids = torch.nn.functional.pad(biogpt_prefix_ids, (pad, 0), value=biogpt_tokenizer.pad_token_id)
+        attention_mask = (torch.arange(bucket) >= pad).long()
+        for _ in range(2):
+            run_biogpt_generate(
+                input_ids.unsqueeze(0).to(biogpt_device),
+                attention_mask.unsqueeze(0).to(biogpt_device),
+                max_new_tokens=4
+            )
+
+def encode_within_budget(text, budget):
+    """Tokenize at most budget tokens of text without running BPE over the rest of it"""
+    if budget <= 0:
+        return []
+    return biogpt_tokenizer.encode(text[:budget * BIOGPT_CHARS_PER_TOKEN], add_special_tokens=False)[:budget]
+
+def build_biogpt_inputs(query, context):
+    """Tokenize a request against the cached prompt scaffolding, left-padding to a bucket when compiled"""
+    query_ids = encode_within_budget(query, BIOGPT_QUERY_BUDGET)
+    # The context gets whatever the fixed scaffolding and the question leave of the largest bucket
+    context_budget = (BIOGPT_PROMPT_BUCKETS[-1] - biogpt_prefix_ids.shape[0]
+                      - len(biogpt_mid_ids) - len(query_ids) - len(biogpt_suffix_ids))
+    context_ids = encode_within_budget(context, context_budget)
+    
+    rest_ids = torch.tensor(context_ids + biogpt_mid_ids + query_ids + biogpt_suffix_ids, dtype=torch.long)
+    input_ids = torch.cat([biogpt_prefix_ids, rest_ids]).unsqueeze(0)
+    attention_mask = torch.ones_like(input_ids)
+    
+    if biogpt_compiled:
+        # Fixed shapes let the compiled forward replay its captured CUDA graphs
+        length = input_ids.shape[1]
+        pad = next(b for b in BIOGPT_PROMPT_BUCKETS if length <= b) - length
+        input_ids = torch.nn.functional.pad(input_ids, (pad, 0), value=biogpt_tokenizer.pad_token_id)
+        attention_mask = torch.nn.functional.pad(attention_mask, (pad, 0), value=0)
+    
+    return input_ids.to(biogpt_device), attention_mask.to(biogpt_device)
+
+def run_biogpt_generate(input_ids, attention_mask, max_new_tokens):
+    """Greedy-decode a continuation for already-tokenized BioGPT inputs"""
+    generate_kwargs = {}
+    if biogpt_static_cache:
+        # Always size the static cache for BIOGPT_MAX_NEW_TOKENS so its shape (and the
+        # captured graph) is the same for every request of a bucket; max_new_tokens only
+        # decides when decoding stops
+        from transformers import StaticCache
+        generate_kwargs['past_key_values'] = StaticCache(
+            config=biogpt_model.config,
+            max_batch_size=input_ids.shape[0],
+            max_cache_len=input_ids.shape[1] + BIOGPT_MAX_NEW_TOKENS,
+            device=biogpt_model.device,
+            dtype=biogpt_model.dtype
+        )
+        max_new_tokens = min(max_new_tokens, BIOGPT_MAX_NEW_TOKENS)
+    
+    with biogpt_generate_lock, torch.inference_mode():
+        return biogpt_model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=biogpt_tokenizer.eos_token_id,
+            do_sample=False,  # Use greedy decoding for speed
+            num_beams=1,  # Use greedy decoding for speed
+            **generate_kwargs
+        )
+
+# Fallback answers used when BioGPT is unavailable or produces a low-quality response
+# A passage is a line longer than 20 characters once stripped that is not a "Source:" citation
+PASSAGE_LINE_RE = re.compile(r'^[^\S\n]*(?!Source:)(\S.{19,}\S)[^\S\n]*$', re.M)
+LOW_QUALITY_PREFIXES = ('what is', 'how to', 'the', 'it is')
+FALLBACK_PASSAGES = 3
+FALLBACK_TEMPLATE = """Based on the medical information provided in the context:
+
+{passages}
+
+This information suggests that {topic} involves the medical concepts described above. However, for accurate diagnosis, personalized treatment recommendations, or specific medical advice, please consult with a qualified healthcare professional who can evaluate your individual situation.
+
+**Disclaimer**: This response is based solely on the provided medical context and should not replace professional medical consultation."""
+NO_PASSAGES_ANSWER = "I could not find sufficient relevant medical information in the provided context to answer your question accurately. Please consult with a healthcare professional for reliable medical advice."
+NO_CONTEXT_ANSWER = "No medical context was provided to answer this question. Please consult with a healthcare professional for accurate medical information."
+
+@lru_cache(maxsize=1024)
+def top_passages(context):
+    """Top context passages, cached because follow-up questions often reuse the same RAG context"""
+    # Stop scanning the context as soon as enough passages have been found
+    return tuple(islice(
+        (match.group(1) for match in PASSAGE_LINE_RE.finditer(context)),
+        FALLBACK_PASSAGES
+    ))
+
+def build_fallback(query, context):
+    """Build a structured answer from the top context passages, or None if there are none"""
+    if not context:
+        return None
+    
+    passages = top_passages(context)
+    if not passages:
+        return None
+    
+    formatted_context = '\n'.join(f"- {passage}" for passage in passages)
+    return FALLBACK_TEMPLATE.format(passages=formatted_context, topic=query.lower())
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     try:
-        # Test embedding model
-        model = load_embedding_model()
-        embedding_status = "✅ Ready" if model else "❌ Failed"
-        
-        # Test BioGPT model
-        try:
-            biogpt, tokenizer = load_biogpt_model()
-            biogpt_status = "✅ Ready" if biogpt and tokenizer else "❌ Failed"
-        except:
-            biogpt_status = "❌ Failed"
+        # Models are loaded once at startup; health only reports their state
+        embedding_ready = embedding_model is not None or onnx_session is not None
+        embedding_status = "✅ Ready" if embedding_ready else "❌ Failed"
+        biogpt_status = "✅ Ready" if biogpt_model and biogpt_tokenizer else "❌ Failed"
         
         return jsonify({
             "status": "healthy",
@@ -99,12 +378,24 @@ def generate_embedding():
         print(f"🧠 Generating embedding for: {text[:50]}...")
         
         # Load and use embedding model
-        model = load_embedding_model()
-        embedding = model.encode([text])[0].tolist()
+        load_embedding_model()
+        embedding = encode_text(text)
+        dimensions = embedding.shape[-1]
+        
+        print(f"✅ Generated PubMedBERT embedding ({dimensions} dimensions)")
         
-        print(f"✅ Generated PubMedBERT embedding ({len(embedding)} dimensions)")
-        return jsonify({"embedding": embedding})
+        # Compact binary form: little-endian float16 bytes, base64-encoded (~2 KB vs ~15 KB of JSON)
+        if request.args.get('format', data.get('format', 'json')) == 'f16':
+            return jsonify({
+                "embedding_b64": base64.b64encode(embedding.astype('<f2').tobytes()).decode('ascii'),
+                "dtype": "float16",
+                "dimensions": dimensions
+            })
+        return jsonify({"embedding": embedding.tolist()})
         
+    except FutureTimeoutError:
+        print(f"❌ Embedding timed out after {EMBED_RESULT_TIMEOUT}s")
+        return jsonify({"error": "Embedding service busy, try again"}), 503
     except Exception as e:
         print(f"❌ Embedding generation failed: {str(e)}")
         return jsonify({"error": f"Embedding generation failed: {str(e)}"}), 500
@@ -117,7 +408,6 @@ def generate_text():
         query = data.get("query", "")
         context = data.get("context", "")
         max_tokens = data.get("max_tokens", 150)
-        temperature = data.get("temperature", 0.7)
         
         if not query:
             return jsonify({"error": "Missing 'query' field."}), 400
@@ -129,69 +419,25 @@ def generate_text():
         
         if not model or not tokenizer:
             # Enhanced fallback response using structured medical format
-            if context and len(context.strip()) > 0:
-                # Parse and clean the context to extract medical information
-                context_lines = context.split('\n')
-                relevant_passages = []
-                
-                for line in context_lines:
-                    line = line.strip()
-                    if line and not line.startswith('Source:') and len(line) > 20:
-                        relevant_passages.append(line)
-                
-                if relevant_passages:
-                    # Take top 3 most relevant passages
-                    top_passages = relevant_passages[:3]
-                    formatted_context = '\n'.join([f"- {passage}" for passage in top_passages])
-                    
-                    # Create structured medical response
-                    fallback_answer = f"""Based on the medical information provided in the context:
-
-{formatted_context}
-
-This information suggests that {query.lower()} involves the medical concepts described above. However, for accurate diagnosis, personalized treatment recommendations, or specific medical advice, please consult with a qualified healthcare professional who can evaluate your individual situation.
-
-**Disclaimer**: This response is based solely on the provided medical context and should not replace professional medical consultation."""
-                else:
-                    fallback_answer = "I could not find sufficient relevant medical information in the provided context to answer your question accurately. Please consult with a healthcare professional for reliable medical advice."
-            else:
-                fallback_answer = "No medical context was provided to answer this question. Please consult with a healthcare professional for accurate medical information."
+            fallback_answer = build_fallback(query, context)
+            if fallback_answer is None:
+                fallback_answer = NO_PASSAGES_ANSWER if context and context.strip() else NO_CONTEXT_ANSWER
             return jsonify({"answer": fallback_answer})
         
-        # Prepare input text with advanced medical prompt structure
-        input_text = f"""You are a helpful and accurate medical assistant. Use the following context to answer the question.
-
-Context:
-{context}
-
-Question: {query}
-
-Answer (based only on the context, no assumptions):"""
-        
         # Generate response with optimized settings
         try:
-            import time
-            
-            inputs = tokenizer.encode(input_text, return_tensors="pt", max_length=256, truncation=True)
+            # Prompt = cached instruction prefix + context/question tokens
+            input_ids, attention_mask = build_biogpt_inputs(query, context)
             
             start_time = time.time()
-            with torch.no_grad():
-                outputs = model.generate(
-                    inputs,
-                    max_length=inputs.shape[1] + min(max_tokens, 60),  # Very conservative token limit
-                    temperature=temperature,
-                    pad_token_id=tokenizer.eos_token_id,
-                    do_sample=False,  # Use greedy decoding for speed
-                    num_beams=1,  # Use greedy decoding for speed
-                    early_stopping=True
-                )
+            # Very conservative token limit
+            outputs = run_biogpt_generate(input_ids, attention_mask, min(max_tokens, BIOGPT_MAX_NEW_TOKENS))
             
             generation_time = time.time() - start_time
             print(f"✅ BioGPT generation completed in {generation_time:.2f}s")
             
-            # Decode response
-            response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            answer = response[len(input_text):].strip()
+            # Decode only the generated tokens (everything after the prompt)
+            answer = tokenizer.decode(outputs[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
             
         except Exception as e:
             print(f"⚠️ BioGPT generation failed: {e}")
@@ -199,32 +445,12 @@ Answer (based only on the context, no assumptions):"""
             answer = None
         
         # Check if the generated answer is too short, low quality, or None (timeout/error)
-        if not answer or len(answer) < 20 or answer.lower().startswith(('what is', 'how to', 'the', 'it is')):
-            print(f"⚠️ BioGPT response too short ({len(answer)} chars), using enhanced fallback")
+        if not answer or len(answer) < 20 or answer.lower().startswith(LOW_QUALITY_PREFIXES):
+            print(f"⚠️ BioGPT response too short ({len(answer or '')} chars), using enhanced fallback")
             # Use the enhanced fallback logic with structured format
-            if context and len(context.strip()) > 0:
-                context_lines = context.split('\n')
-                relevant_passages = []
-                
-                for line in context_lines:
-                    line = line.strip()
-                    if line and not line.startswith('Source:') and len(line) > 20:
-                        relevant_passages.append(line)
-                
-                if relevant_passages:
-                    # Take top 3 most relevant passages
-                    top_passages = relevant_passages[:3]
-                    formatted_context = '\n'.join([f"- {passage}" for passage in top_passages])
-                    
-                    # Create structured medical response
-                    enhanced_answer = f"""Based on the medical information provided in the context:
-
-{formatted_context}
-
-This information suggests that {query.lower()} involves the medical concepts described above. However, for accurate diagnosis, personalized treatment recommendations, or specific medical advice, please consult with a qualified healthcare professional who can evaluate your individual situation.
-
-**Disclaimer**: This response is based solely on the provided medical context and should not replace professional medical consultation."""
-                    return jsonify({"answer": enhanced_answer})
+            enhanced_answer = build_fallback(query, context)
+            if enhanced_answer is not None:
+                return jsonify({"answer": enhanced_answer})
         
         print(f"✅ Generated response ({len(answer)} chars)")
         return jsonify({"answer": answer})
@@ -270,17 +496,26 @@ if __name__ == '__main__':
     print("🚀 Starting Local Flask Server for WellnessGrid...")
     print("📡 Endpoints:")
     print("  - GET  /health  - Health check")
-    print("  - POST /embed   - Generate PubMedBERT embeddings")
+    print("  - POST /embed   - Generate PubMedBERT embeddings (?format=f16 for base64 float16)")
     print("  - POST /generate - Generate text with BioGPT")
     print("  - POST /ask     - Main RAG endpoint")
     print("")
     print("🧠 Loading models (this may take a few minutes)...")
     
-    # Pre-load embedding model
+    # Pre-load both models so the first request is not a cold start
     try:
         load_embedding_model()
     except Exception as e:
         print(f"⚠️ Could not load embedding model: {e}")
+    load_biogpt_model()
     
-    print("🌐 Starting Flask server on http://localhost:5001...")
-    app.run(host='0.0.0.0', port=5001, debug=True) 
\ No newline at end of file
+    # One process with many threads so concurrent /embed calls reach the batcher together
+    try:
+        from waitress import serve
+        print("🌐 Starting Waitress server on http://localhost:5001...")
+        serve(app, host='0.0.0.0', port=5001, threads=16)
+    except ImportError:
+        print("⚠️ waitress not installed, falling back to the Flask dev server (pip install waitress)")
+        print("🌐 Starting Flask server on http://localhost:5001...")
+        # debug=False: the reloader would fork and load every model a second time
+        app.run(host='0.0.0.0', port=5001, debug=False, threaded=True)
\ No newline at end of file
@@ -215,7 +215,7 @@ CREATE TABLE IF NOT EXISTS document_embeddings (
     document_id UUID REFERENCES medical_documents(id) ON DELETE CASCADE,
     chunk_index INTEGER NOT NULL,
     chunk_content TEXT NOT NULL,
-    embedding VECTOR(768), -- PubMedBERT embeddings are 768-dimensional
+    embedding HALFVEC(768), -- PubMedBERT embeddings are 768-dimensional, stored at half precision (pgvector 0.7+)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -225,9 +225,26 @@ CREATE INDEX IF NOT EXISTS idx_medical_documents_topic ON medical_documents(topi
 CREATE INDEX IF NOT EXISTS idx_medical_documents_type ON medical_documents(document_type);
 CREATE INDEX IF NOT EXISTS idx_document_embeddings_document_id ON document_embeddings(document_id);
 
+-- Migrate full-precision embeddings to halfvec: half the heap, index and wire size,
+-- with negligible effect on cosine ranking. This replaces the earlier layout of a
+-- VECTOR(768) column with an HNSW expression index on embedding::halfvec(768); that
+-- index shares the idx_document_embeddings_halfvec name and is dropped here. Loaders
+-- send untyped pgvector text or float16 binary, which the column accepts directly.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'document_embeddings' AND column_name = 'embedding' AND udt_name = 'vector'
+    ) THEN
+        DROP INDEX IF EXISTS idx_document_embeddings_vector;
+        DROP INDEX IF EXISTS idx_document_embeddings_halfvec;
+        ALTER TABLE document_embeddings ALTER COLUMN embedding TYPE halfvec(768) USING embedding::halfvec(768);
+    END IF;
+END $$;
+
 -- Create vector similarity search index (HNSW for better performance)
-CREATE INDEX IF NOT EXISTS idx_document_embeddings_vector 
-ON document_embeddings USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_document_embeddings_halfvec
+ON document_embeddings USING hnsw (embedding halfvec_cosine_ops);
 
 -- Create updated_at trigger for medical_documents
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -261,9 +278,10 @@ LANGUAGE plpgsql
 AS $$
 BEGIN
     RETURN QUERY
+    -- The query is cast to halfvec so the HNSW index on the halfvec column is used
     SELECT 
         de.chunk_content,
-        1 - (de.embedding <=> query_embedding) AS similarity,
+        1 - (de.embedding <=> query_embedding::halfvec(768)) AS similarity,
         md.source,
         md.topic,
         md.title,
@@ -271,8 +289,8 @@ BEGIN
         md.id AS document_id
     FROM document_embeddings de
     JOIN medical_documents md ON de.document_id = md.id
-    WHERE 1 - (de.embedding <=> query_embedding) > match_threshold
-    ORDER BY de.embedding <=> query_embedding
+    WHERE 1 - (de.embedding <=> query_embedding::halfvec(768)) > match_threshold
+    ORDER BY de.embedding <=> query_embedding::halfvec(768)
     LIMIT match_count;
 END;
 $$;
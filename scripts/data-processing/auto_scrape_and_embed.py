@@ -3,7 +3,7 @@
 Automated Medical Document Scraping and Embedding Pipeline
 - Runs enhanced web scraping to collect 500-1000 medical documents
 - Processes documents into 768-dimensional embeddings
-- Uploads to Supabase using MCP tools
+- Uploads to Supabase over a direct Postgres connection (binary COPY into pgvector)
 - Monitors progress and provides detailed reporting
 """
 
@@ -12,10 +12,13 @@ import json
 import logging
 import time
 import os
+import sqlite3
 import sys
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 import hashlib
+import glob
+import uuid
 
 # Add project root to path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,15 +28,37 @@ sys.path.insert(0, project_root)
 sys.path.insert(0, os.path.join(project_root, 'scripts', 'web-scraping'))
 from enhanced_medical_scraper import EnhancedMedicalScraper
 
+# Let the CPU math libraries use every core (must be set before torch is imported)
+os.environ.setdefault('OMP_NUM_THREADS', str(os.cpu_count() or 8))
+os.environ.setdefault('MKL_NUM_THREADS', str(os.cpu_count() or 8))
+
 # Import embedding tools
 try:
     from sentence_transformers import SentenceTransformer
+    import ijson
+    import numpy as np
+    import psycopg
     import torch
+    from pgvector.psycopg import register_vector_async
+    from psycopg.types.json import Json
+    from tqdm.auto import tqdm
 except ImportError:
     print("Please install required packages:")
-    print("pip install sentence-transformers torch")
+    print("pip install sentence-transformers torch numpy ijson 'psycopg[binary]' pgvector tqdm")
     exit(1)
 
+# Optional orjson for writing reports (C encoder, serializes NumPy values directly)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional ONNX Runtime backend for embeddings (fused kernels, exported once and reused across runs)
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -45,12 +70,62 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ENCODE_BATCH_SIZE = 64  # Chunks per forward pass
+PIPELINE_ENCODE_CHUNKS = 256  # Chunks handed to the encoder stage at a time
+EMBEDDING_MODEL_NAME = 'NeuML/pubmedbert-base-embeddings'
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_cache.sqlite3'))
+REQUIRED_DOCUMENT_FIELDS = ('title', 'content', 'source', 'topic', 'url')
+
+DOCUMENT_INSERT_SQL = """
+INSERT INTO medical_documents (id, title, content, source, topic, url, document_type, metadata, content_length)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (id) DO NOTHING
+RETURNING id
+"""
+EMBEDDING_COPY_SQL = "COPY document_embeddings (document_id, chunk_index, chunk_content, embedding) FROM STDIN (FORMAT BINARY)"
+ONNX_MODEL_DIR = os.environ.get('PUBMEDBERT_ONNX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pubmedbert_onnx'))
+
+class EmbeddingCache:
+    """SQLite-backed store of chunk embeddings keyed by a hash of the model and chunk text"""
+    
+    def __init__(self, path: str):
+        # Only the encoder stage touches the cache, one batch at a time, from worker threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+    
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(f"{EMBEDDING_MODEL_NAME}\0{text}".encode('utf-8'), digest_size=16).digest()
+    
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            rows = self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part)
+            found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+    
+    def put_many(self, keys: List[bytes], embeddings: np.ndarray):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                ((key, embedding.tobytes()) for key, embedding in zip(keys, embeddings))
+            )
+    
+    def close(self):
+        self.conn.close()
+
 class AutoScrapingEmbeddingPipeline:
     """Automated pipeline for scraping and embedding medical documents"""
     
     def __init__(self):
         self.embedding_model = None
         self.device = None
+        self.num_gpus = 0
+        self.encode_pool = None  # SentenceTransformer multi-process pool when several GPUs are used
+        self.db_conn = None  # Postgres connection used by the upload stage
+        self.embedding_cache = None  # Embeddings from earlier runs, reused for unchanged chunks
         self.embedding_dimension = 768  # PubMedBERT dimension
         
         # Statistics
@@ -64,7 +139,8 @@ class AutoScrapingEmbeddingPipeline:
             'total_chunks_created': 0,
             'failed_embeddings': 0,
             'upload_success': 0,
-            'upload_failures': 0
+            'upload_failures': 0,
+            'cached_embeddings': 0
         }
         
         logger.info("🤖 Automated Scraping & Embedding Pipeline initialized")
@@ -80,17 +156,14 @@ class AutoScrapingEmbeddingPipeline:
             # Step 1: Enhanced Web Scraping
             scraped_file = await self.run_enhanced_scraping()
             
-            # Step 2: Load and validate documents
-            documents = self.load_scraped_documents(scraped_file)
+            # Step 2: Stream and validate documents (consumed lazily by the chunker stage)
+            documents = self.iter_scraped_documents(scraped_file)
             
             # Step 3: Initialize embedding model
             self.setup_embedding_model()
             
-            # Step 4: Process documents into embeddings
-            embeddings_data = await self.process_documents_to_embeddings(documents)
-            
-            # Step 5: Upload to Supabase via MCP
-            upload_results = await self.upload_to_supabase_mcp(embeddings_data)
+            # Steps 4-5: Chunk, embed and upload to Supabase, overlapping the stages
+            await self.process_and_upload_documents(documents)
             
             # Step 6: Generate final report
             report = self.generate_pipeline_report()
@@ -130,26 +203,21 @@ class AutoScrapingEmbeddingPipeline:
             logger.error(f"❌ Scraping failed: {str(e)}")
             raise
     
-    def load_scraped_documents(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load and validate scraped documents"""
-        logger.info(f"📄 Loading scraped documents from: {file_path}")
+    def iter_scraped_documents(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream and validate scraped documents one at a time"""
+        logger.info(f"📄 Streaming scraped documents from: {file_path}")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            documents = data.get('documents', [])
-            
-            # Validate documents
-            valid_documents = []
-            for doc in documents:
-                if self.validate_document_structure(doc):
-                    valid_documents.append(doc)
-                else:
-                    logger.warning(f"Invalid document structure: {doc.get('title', 'Unknown')}")
+            valid_count = 0
+            with open(file_path, 'rb') as f:
+                for doc in ijson.items(f, 'documents.item', use_float=True):
+                    if self.validate_document_structure(doc):
+                        valid_count += 1
+                        yield doc
+                    else:
+                        logger.warning(f"Invalid document structure: {doc.get('title', 'Unknown')}")
             
-            logger.info(f"✅ Loaded {len(valid_documents)} valid documents")
-            return valid_documents
+            logger.info(f"✅ Loaded {valid_count} valid documents")
             
         except Exception as e:
             logger.error(f"❌ Failed to load documents: {str(e)}")
@@ -157,8 +225,7 @@ class AutoScrapingEmbeddingPipeline:
     
     def validate_document_structure(self, doc: Dict[str, Any]) -> bool:
         """Validate document has required fields"""
-        required_fields = ['title', 'content', 'source', 'topic', 'url']
-        return all(field in doc and doc[field] for field in required_fields)
+        return all(map(doc.get, REQUIRED_DOCUMENT_FIELDS))
     
     def setup_embedding_model(self):
         """Initialize PubMedBERT embedding model"""
@@ -167,11 +234,33 @@ class AutoScrapingEmbeddingPipeline:
         try:
             # Check for GPU
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            logger.info(f"🔧 Using device: {self.device}")
-            
-            # Load PubMedBERT model
-            model_name = 'NeuML/pubmedbert-base-embeddings'
-            self.embedding_model = SentenceTransformer(model_name, device=self.device)
+            self.num_gpus = torch.cuda.device_count()
+            logger.info(f"🔧 Using device: {self.device} ({self.num_gpus} GPUs available)")
+            
+            # Inference only: no autograd bookkeeping, and all cores for CPU matmuls
+            torch.set_grad_enabled(False)
+            if self.device.type == 'cpu':
+                torch.set_num_threads(os.cpu_count() or 8)
+            
+            # Load PubMedBERT model, preferring ONNX Runtime when it is installed
+            if ort is not None:
+                self.embedding_model = self.load_onnx_embedding_model()
+            if self.embedding_model is None:
+                # SDPA fused attention kernels for the PyTorch backend
+                self.embedding_model = SentenceTransformer(
+                    EMBEDDING_MODEL_NAME,
+                    device=self.device,
+                    model_kwargs={'attn_implementation': 'sdpa'}
+                )
+                
+                # fp16 weights halve memory traffic and use tensor cores on GPU
+                if self.device.type == 'cuda':
+                    self.embedding_model.half()
+                
+                # One encoder process per GPU; chunk batches are split across them
+                if self.num_gpus > 1:
+                    self.encode_pool = self.embedding_model.start_multi_process_pool()
+                    logger.info(f"🚀 Encoding on {self.num_gpus} GPUs")
             
             # Verify embedding dimension
             test_embedding = self.embedding_model.encode(["test text"])
@@ -187,68 +276,199 @@ class AutoScrapingEmbeddingPipeline:
             logger.error(f"❌ Failed to setup embedding model: {str(e)}")
             raise
     
-    async def process_documents_to_embeddings(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Process documents into embeddings with chunking"""
-        logger.info("🔢 Phase 3: Processing documents into embeddings")
-        embedding_start = time.time()
+    def load_onnx_embedding_model(self) -> Optional[SentenceTransformer]:
+        """Load PubMedBERT on ONNX Runtime, exporting it to ONNX_MODEL_DIR on the first run"""
+        available = ort.get_available_providers()
+        provider = 'CUDAExecutionProvider' if 'CUDAExecutionProvider' in available else 'CPUExecutionProvider'
+        exported = bool(glob.glob(os.path.join(ONNX_MODEL_DIR, '**', '*.onnx'), recursive=True))
+        
+        try:
+            if not exported:
+                logger.info(f"📦 Exporting PubMedBERT to ONNX in {ONNX_MODEL_DIR} (one-time)...")
+            model = SentenceTransformer(
+                ONNX_MODEL_DIR if exported else EMBEDDING_MODEL_NAME,
+                device=self.device,
+                backend='onnx',
+                model_kwargs={'provider': provider}
+            )
+            if not exported:
+                model.save(ONNX_MODEL_DIR)
+            
+            logger.info(f"⚡ Using ONNX Runtime backend ({provider})")
+            return model
+            
+        except Exception as e:
+            logger.warning(f"⚠️ ONNX Runtime unavailable for PubMedBERT, using PyTorch: {str(e)}")
+            return None
+    
+    async def process_and_upload_documents(self, documents: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Chunk, embed and upload documents as concurrent stages connected by bounded queues"""
+        logger.info("🔢 Phase 3: Chunking, embedding and uploading documents concurrently")
+        stage_start = time.time()
         
-        embeddings_data = []
+        # Bounded queues apply backpressure: chunking stays a few batches ahead of the
+        # encoder, and the encoder a few batches ahead of the upload
+        encode_queue = asyncio.Queue(maxsize=8)
+        upload_queue = asyncio.Queue(maxsize=8)
+        
+        upload_results = {
+            'documents_inserted': 0,
+            'embeddings_inserted': 0,
+            'failed_uploads': 0,
+            'batch_results': []
+        }
+        
+        db_url = os.environ.get("SUPABASE_DB_URL")
+        if not db_url:
+            raise ValueError("SUPABASE_DB_URL must be set to the Postgres connection string")
+        
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        
+        try:
+            async with await psycopg.AsyncConnection.connect(db_url) as conn:
+                await register_vector_async(conn)
+                self.db_conn = conn
+                await asyncio.gather(
+                    self.chunk_documents(documents, encode_queue),
+                    self.embed_chunk_batches(encode_queue, upload_queue, stage_start),
+                    self.upload_document_groups(upload_queue, upload_results, stage_start)
+                )
+            return upload_results
+            
+        except Exception as e:
+            logger.error(f"❌ Embedding pipeline failed: {str(e)}")
+            raise
+        
+        finally:
+            self.db_conn = None
+            self.embedding_cache.close()
+            if self.encode_pool is not None:
+                self.embedding_model.stop_multi_process_pool(self.encode_pool)
+                self.encode_pool = None
+    
+    async def chunk_documents(self, documents: Iterable[Dict[str, Any]], encode_queue: asyncio.Queue):
+        """Chunk documents and queue them, whole, in batches of about PIPELINE_ENCODE_CHUNKS chunks"""
         chunk_size = 512  # Characters per chunk
         overlap = 100
         
-        try:
-            for i, doc in enumerate(documents):
-                if i % 50 == 0:
-                    logger.info(f"📊 Processing document {i+1}/{len(documents)}")
+        batch = []  # (document_id, content, entries) tuples
+        batch_chunks = 0
+        document_count = 0
+        # tqdm throttles its own refreshes and keeps per-document progress out of the log file
+        for i, doc in enumerate(tqdm(documents, desc="📊 Chunking", unit="doc")):
+            document_count += 1
+            
+            try:
+                # Create chunks from document content
+                chunks = await asyncio.to_thread(self.create_text_chunks, doc['content'], chunk_size, overlap)
+                doc_id = self.generate_document_id(doc)
                 
-                try:
-                    # Create chunks from document content
-                    chunks = self.create_text_chunks(doc['content'], chunk_size, overlap)
-                    
-                    for chunk_idx, chunk_text in enumerate(chunks):
-                        # Generate embedding
-                        embedding = self.embedding_model.encode([chunk_text])[0].tolist()
-                        
-                        # Create embedding data entry
-                        embedding_entry = {
-                            'document_id': self.generate_document_id(doc),
-                            'chunk_index': chunk_idx,
-                            'chunk_content': chunk_text,
-                            'embedding': embedding,
-                            'metadata': {
-                                'title': doc['title'],
-                                'source': doc['source'],
-                                'topic': doc['topic'],
-                                'url': doc['url'],
-                                'document_type': doc.get('document_type', 'medical_information'),
-                                'category': doc.get('category', 'unknown'),
-                                'scraped_date': doc.get('scraped_date', ''),
-                                'chunk_count': len(chunks),
-                                'embedding_date': datetime.now().isoformat()
-                            }
-                        }
-                        
-                        embeddings_data.append(embedding_entry)
-                        self.pipeline_stats['total_chunks_created'] += 1
+                # Metadata is the same for every chunk of a document, so build it once
+                base_metadata = {
+                    'title': doc['title'],
+                    'source': doc['source'],
+                    'topic': doc['topic'],
+                    'url': doc['url'],
+                    'document_type': doc.get('document_type', 'medical_information'),
+                    'category': doc.get('category', 'unknown'),
+                    'scraped_date': doc.get('scraped_date', ''),
+                    'chunk_count': len(chunks),
+                    'embedding_date': datetime.now().isoformat()
+                }
                 
-                except Exception as e:
-                    logger.error(f"❌ Failed to process document {i}: {str(e)}")
-                    self.pipeline_stats['failed_embeddings'] += 1
-                    continue
-            
-            # Update statistics
-            self.pipeline_stats['embedding_duration'] = time.time() - embedding_start
-            self.pipeline_stats['total_documents_embedded'] = len(documents) - self.pipeline_stats['failed_embeddings']
+                entries = []
+                for chunk_idx, chunk_text in enumerate(chunks):
+                    # Create embedding data entry (embedding filled in by the encoder stage)
+                    embedding_entry = {
+                        'document_id': doc_id,
+                        'chunk_index': chunk_idx,
+                        'chunk_content': chunk_text,
+                        'embedding': None,
+                        'metadata': base_metadata.copy()
+                    }
+                    entries.append(embedding_entry)
             
-            logger.info(f"✅ Embedding completed: {len(embeddings_data)} chunks created")
-            logger.info(f"📊 Successful: {self.pipeline_stats['total_documents_embedded']}")
-            logger.info(f"❌ Failed: {self.pipeline_stats['failed_embeddings']}")
+            except Exception as e:
+                logger.error(f"❌ Failed to process document {i}: {str(e)}")
+                self.pipeline_stats['failed_embeddings'] += 1
+                continue
+            
+            batch.append((doc_id, doc['content'], entries))
+            batch_chunks += len(entries)
+            if batch_chunks >= PIPELINE_ENCODE_CHUNKS * max(self.num_gpus, 1):
+                await encode_queue.put(batch)
+                batch, batch_chunks = [], 0
+        
+        if batch:
+            await encode_queue.put(batch)
+        self.pipeline_stats['total_documents_embedded'] = document_count - self.pipeline_stats['failed_embeddings']
+        await encode_queue.put(None)
+    
+    async def embed_chunk_batches(self, encode_queue: asyncio.Queue, upload_queue: asyncio.Queue, stage_start: float):
+        """Embed queued chunk batches in a worker thread and pass them on for upload"""
+        while True:
+            batch = await encode_queue.get()
+            if batch is None:
+                break
             
-            return embeddings_data
+            entries = [entry for _, _, doc_entries in batch for entry in doc_entries]
+            embeddings = await asyncio.to_thread(self.encode_chunks, [entry['chunk_content'] for entry in entries])
+            # Entries keep float32 row views into the batch array rather than 768 Python floats
+            # each; convert only at the database boundary
+            for embedding_entry, embedding in zip(entries, embeddings):
+                embedding_entry['embedding'] = embedding
             
-        except Exception as e:
-            logger.error(f"❌ Embedding process failed: {str(e)}")
-            raise
+            self.pipeline_stats['total_chunks_created'] += len(entries)
+            logger.info(f"🧠 Embedded {self.pipeline_stats['total_chunks_created']} chunks so far")
+            await upload_queue.put(batch)
+        
+        # Update statistics
+        self.pipeline_stats['embedding_duration'] = time.time() - stage_start
+        
+        logger.info(f"✅ Embedding completed: {self.pipeline_stats['total_chunks_created']} chunks created")
+        logger.info(f"♻️ Reused from cache: {self.pipeline_stats['cached_embeddings']}")
+        logger.info(f"📊 Successful: {self.pipeline_stats['total_documents_embedded']}")
+        logger.info(f"❌ Failed: {self.pipeline_stats['failed_embeddings']}")
+        await upload_queue.put(None)
+    
+    def encode_chunks(self, chunk_texts: List[str]) -> np.ndarray:
+        """Embed a batch of chunk texts, reusing cached embeddings (called from a worker thread)"""
+        keys = [EmbeddingCache.key(text) for text in chunk_texts]
+        cached = self.embedding_cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        
+        embeddings = np.empty((len(chunk_texts), self.embedding_dimension), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key in cached:
+                embeddings[i] = cached[key]
+        
+        if missing:
+            new_embeddings = self.encode_texts([chunk_texts[i] for i in missing])
+            embeddings[missing] = new_embeddings
+            self.embedding_cache.put_many([keys[i] for i in missing], new_embeddings)
+        
+        self.pipeline_stats['cached_embeddings'] += len(chunk_texts) - len(missing)
+        return embeddings
+    
+    def encode_texts(self, chunk_texts: List[str]) -> np.ndarray:
+        """Run the embedding model over chunk texts"""
+        # encode() length-sorts the batch before splitting it into forward passes and restores
+        # the input order, so each forward pass is padded only to similar-length chunks
+        if self.encode_pool is not None:
+            return self.embedding_model.encode_multi_process(
+                chunk_texts,
+                self.encode_pool,
+                batch_size=ENCODE_BATCH_SIZE,
+                chunk_size=-(-len(chunk_texts) // self.num_gpus)
+            ).astype('float32', copy=False)
+        
+        with torch.inference_mode():
+            return self.embedding_model.encode(
+                chunk_texts,
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            ).astype('float32', copy=False)  # fp16 on GPU; cached as float32, uploaded as halfvec
     
     def create_text_chunks(self, text: str, chunk_size: int, overlap: int) -> List[str]:
         """Create overlapping text chunks"""
@@ -258,15 +478,20 @@ class AutoScrapingEmbeddingPipeline:
         chunks = []
         start = 0
         
+        # Offsets of every period, found in one vectorized scan (UTF-32 keeps one code unit per character;
+        # surrogatepass keeps lone surrogates from JSON input encodable)
+        codepoints = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        periods = np.flatnonzero(codepoints == ord('.'))
+        
         while start < len(text):
             end = start + chunk_size
             
             # Try to break at sentence boundary
             if end < len(text):
-                # Look for sentence ending near the chunk boundary
-                sentence_end = text.rfind('.', start + chunk_size - 200, end)
-                if sentence_end > start:
-                    end = sentence_end + 1
+                # Last sentence ending in the 200 characters before the chunk boundary
+                idx = np.searchsorted(periods, end)
+                if idx > 0 and periods[idx - 1] >= start + chunk_size - 200 and periods[idx - 1] > start:
+                    end = int(periods[idx - 1]) + 1
             
             chunk = text[start:end].strip()
             if chunk:
@@ -283,39 +508,25 @@ class AutoScrapingEmbeddingPipeline:
         """Generate unique document ID"""
         # Create hash from URL and title
         content = f"{doc['url']}_{doc['title']}"
-        return hashlib.md5(content.encode()).hexdigest()
+        # 128-bit BLAKE2b keeps the 32-character hex ID format and hashes faster than MD5
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
     
-    async def upload_to_supabase_mcp(self, embeddings_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Upload embeddings to Supabase using MCP tools (simulated)"""
-        logger.info("🗄️ Phase 4: Uploading to Supabase via MCP")
-        upload_start = time.time()
-        
-        # This would normally use actual MCP tools, but for now we'll simulate
-        # the upload process and prepare the data structure
-        
-        upload_results = {
-            'documents_inserted': 0,
-            'embeddings_inserted': 0,
-            'failed_uploads': 0,
-            'batch_results': []
-        }
+    async def upload_document_groups(self, upload_queue: asyncio.Queue, upload_results: Dict[str, Any], stage_start: float):
+        """Upload embedded documents to Supabase as batches arrive"""
+        logger.info("🗄️ Phase 4: Uploading to Supabase")
         
-        try:
-            # Group embeddings by document for efficient upload
-            document_groups = {}
-            for entry in embeddings_data:
-                doc_id = entry['document_id']
-                if doc_id not in document_groups:
-                    document_groups[doc_id] = []
-                document_groups[doc_id].append(entry)
+        batch_size = 10
+        batch_number = 0
+        while True:
+            document_items = await upload_queue.get()
+            if document_items is None:
+                break
             
             # Process documents in batches
-            batch_size = 10
-            document_items = list(document_groups.items())
-            
             for i in range(0, len(document_items), batch_size):
                 batch = document_items[i:i + batch_size]
-                logger.info(f"📤 Uploading batch {i//batch_size + 1}/{(len(document_items) + batch_size - 1)//batch_size}")
+                batch_number += 1
+                logger.info(f"📤 Uploading batch {batch_number} ({len(batch)} documents)")
                 
                 batch_result = await self.upload_document_batch(batch)
                 upload_results['batch_results'].append(batch_result)
@@ -324,59 +535,65 @@ class AutoScrapingEmbeddingPipeline:
                 upload_results['documents_inserted'] += batch_result['documents_success']
                 upload_results['embeddings_inserted'] += batch_result['embeddings_success']
                 upload_results['failed_uploads'] += batch_result['failures']
-                
-                # Rate limiting
-                await asyncio.sleep(0.5)
-            
-            # Update statistics
-            self.pipeline_stats['upload_duration'] = time.time() - upload_start
-            self.pipeline_stats['upload_success'] = upload_results['embeddings_inserted']
-            self.pipeline_stats['upload_failures'] = upload_results['failed_uploads']
-            
-            logger.info(f"✅ Upload completed:")
-            logger.info(f"📄 Documents: {upload_results['documents_inserted']}")
-            logger.info(f"🔢 Embeddings: {upload_results['embeddings_inserted']}")
-            logger.info(f"❌ Failed: {upload_results['failed_uploads']}")
-            
-            return upload_results
-            
-        except Exception as e:
-            logger.error(f"❌ Upload failed: {str(e)}")
-            raise
+        
+        # Update statistics
+        self.pipeline_stats['upload_duration'] = time.time() - stage_start
+        self.pipeline_stats['upload_success'] = upload_results['embeddings_inserted']
+        self.pipeline_stats['upload_failures'] = upload_results['failed_uploads']
+        
+        logger.info(f"✅ Upload completed:")
+        logger.info(f"📄 Documents: {upload_results['documents_inserted']}")
+        logger.info(f"🔢 Embeddings: {upload_results['embeddings_inserted']}")
+        logger.info(f"❌ Failed: {upload_results['failed_uploads']}")
     
     async def upload_document_batch(self, batch: List[tuple]) -> Dict[str, Any]:
-        """Upload a batch of documents and embeddings"""
+        """Upload a batch of documents, then stream their embeddings in one binary COPY"""
         batch_result = {
             'documents_success': 0,
             'embeddings_success': 0,
             'failures': 0
         }
         
-        for doc_id, chunks in batch:
-            try:
-                # Simulate document and embedding insertion
-                # In real implementation, this would use MCP Supabase tools
-                
-                # First, insert document metadata
-                if chunks:
-                    first_chunk = chunks[0]
-                    doc_metadata = first_chunk['metadata']
-                    
-                    # This would be actual MCP call:
-                    # await self.insert_document_mcp(doc_id, doc_metadata)
-                    batch_result['documents_success'] += 1
+        document_rows = []
+        for doc_id, content, chunks in batch:
+            if chunks:
+                metadata = chunks[0]['metadata']
+                document_rows.append((
+                    uuid.UUID(hex=doc_id), metadata['title'], content, metadata['source'], metadata['topic'],
+                    metadata['url'], metadata['document_type'], Json(metadata), len(content)
+                ))
+        
+        try:
+            # One transaction per batch: documents first so the embeddings' foreign keys resolve
+            async with self.db_conn.transaction():
+                async with self.db_conn.cursor() as cur:
+                    await cur.executemany(DOCUMENT_INSERT_SQL, document_rows, returning=True)
+                    # Ids are deterministic, so a rerun skips existing documents; only their new rows come back
+                    inserted_ids = set()
+                    while True:
+                        row = await cur.fetchone()
+                        if row:
+                            inserted_ids.add(row[0])
+                        if not cur.nextset():
+                            break
                     
-                    # Then insert all chunks with embeddings
-                    for chunk in chunks:
-                        # This would be actual MCP call:
-                        # await self.insert_embedding_mcp(chunk)
-                        batch_result['embeddings_success'] += 1
-                
-                await asyncio.sleep(0.1)  # Simulate processing time
-                
-            except Exception as e:
-                logger.error(f"❌ Failed to upload document {doc_id}: {str(e)}")
-                batch_result['failures'] += 1
+                    async with cur.copy(EMBEDDING_COPY_SQL) as copy:
+                        # The column is halfvec(768): binary COPY must send float2 values, not vector's float4
+                        copy.set_types(['uuid', 'int4', 'text', 'halfvec'])
+                        for doc_id, _, chunks in batch:
+                            document_uuid = uuid.UUID(hex=doc_id)
+                            if document_uuid not in inserted_ids:
+                                continue
+                            for chunk in chunks:
+                                await copy.write_row((document_uuid, chunk['chunk_index'], chunk['chunk_content'], chunk['embedding'].astype(np.float16)))
+                                batch_result['embeddings_success'] += 1
+            
+            batch_result['documents_success'] = len(inserted_ids)
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to upload batch of {len(batch)} documents: {str(e)}")
+            batch_result['embeddings_success'] = 0
+            batch_result['failures'] = len(batch)
         
         return batch_result
     
@@ -403,7 +620,8 @@ class AutoScrapingEmbeddingPipeline:
                 'chunks_created': self.pipeline_stats['total_chunks_created'],
                 'embeddings_uploaded': self.pipeline_stats['upload_success'],
                 'failed_embeddings': self.pipeline_stats['failed_embeddings'],
-                'failed_uploads': self.pipeline_stats['upload_failures']
+                'failed_uploads': self.pipeline_stats['upload_failures'],
+                'embeddings_reused_from_cache': self.pipeline_stats['cached_embeddings']
             },
             'efficiency_metrics': {
                 'documents_per_minute': round(self.pipeline_stats['total_documents_scraped'] / (total_duration / 60), 2),
@@ -440,8 +658,12 @@ class AutoScrapingEmbeddingPipeline:
         
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
         
         logger.info(f"📊 Pipeline report saved to: {filename}")
         return filename
@@ -494,5 +716,12 @@ async def main():
         raise
 
 if __name__ == "__main__":
+    # uvloop speeds up the queue/gather coordination between pipeline stages; optional (not on Windows)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     # Run the automated pipeline
     asyncio.run(main()) 
\ No newline at end of file
@@ -4,126 +4,146 @@ Bulk Migration Script for WellnessGrid RAG System
 This script efficiently migrates all remaining documents and embeddings.
 """
 
-import json
 import os
-import subprocess
-import time
-from typing import List, Dict
-import uuid
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Sequence
+
+try:
+    import ijson
+    from psycopg.types.json import Json
+    from psycopg_pool import ConnectionPool
+except ImportError as e:
+    print(f"❌ Missing package: {e}")
+    print("📦 Install with: pip install ijson 'psycopg[binary,pool]'")
+    sys.exit(1)
+
+DOCUMENT_INSERT_SQL = """
+INSERT INTO medical_documents (title, content, source, topic, url, document_type, metadata, content_length)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Batches are inserted concurrently, each on its own pooled connection
+MIGRATION_WORKERS = 4
 
 class BulkMigrator:
     def __init__(self):
         self.scraped_docs_file = "scraped_medical_documents.json"
         self.current_doc_count = 39  # Starting from current count
         self.current_embedding_count = 504
+        self.documents_read = 0
+        self.total_migrated = 0
+        self.migrated_lock = threading.Lock()
+        self.migration_failed = threading.Event()
+        self.completed_batches = set()  # batch numbers committed, used to report a resume point
+        
+        # Connections are opened once and shared by the batch workers instead of a Supabase CLI process per batch
+        db_url = os.environ.get("SUPABASE_DB_URL")
+        if not db_url:
+            raise ValueError("SUPABASE_DB_URL must be set to the Postgres connection string")
+        self.pool = ConnectionPool(db_url, min_size=MIGRATION_WORKERS, max_size=MIGRATION_WORKERS * 2, open=True)
         
-    def load_scraped_documents(self) -> List[Dict]:
-        """Load the scraped documents"""
+    def iter_scraped_documents(self) -> Iterator[Dict]:
+        """Stream the scraped documents one at a time instead of loading the whole file"""
         if not os.path.exists(self.scraped_docs_file):
             raise FileNotFoundError(f"File not found: {self.scraped_docs_file}")
-            
-        with open(self.scraped_docs_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return self._stream_documents()
     
-    def generate_document_sql(self, docs: List[Dict], start_idx: int = 0) -> str:
-        """Generate SQL for inserting documents"""
-        sql_statements = []
-        
-        for i, doc in enumerate(docs[start_idx:], start_idx):
-            # Skip the first document which is already inserted
-            if i == 0:
-                continue
-                
-            sql = f"""
-INSERT INTO medical_documents (title, content, source, topic, url, document_type, metadata, content_length)
-VALUES (
-    '{doc['title'].replace("'", "''")}',
-    '{doc['content'].replace("'", "''")}',
-    '{doc['source']}',
-    '{doc['topic']}',
-    '{doc['url']}',
-    '{doc['document_type']}',
-    '{json.dumps(doc['metadata']).replace("'", "''")}',
-    {doc['content_length']}
-);"""
-            sql_statements.append(sql)
-        
-        return '\n'.join(sql_statements)
+    def _stream_documents(self) -> Iterator[Dict]:
+        with open(self.scraped_docs_file, 'rb') as f:
+            for doc in ijson.items(f, 'item', use_float=True):
+                self.documents_read += 1
+                yield doc
     
-    def run_supabase_command(self, sql: str) -> bool:
-        """Execute SQL via Supabase CLI"""
+    @staticmethod
+    def document_row(doc: Dict) -> tuple:
+        """Build the DOCUMENT_INSERT_SQL parameters for a document (values are sent unescaped)"""
+        return (doc['title'], doc['content'], doc['source'], doc['topic'], doc['url'],
+                doc['document_type'], Json(doc['metadata']), doc['content_length'])
+    
+    def run_sql(self, sql: str, rows: Sequence[tuple]) -> bool:
+        """Execute a parameterized statement for every row in one transaction on a pooled psycopg connection"""
         try:
-            # Write SQL to temporary file
-            temp_file = f"temp_migration_{int(time.time())}.sql"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(sql)
-            
-            # Execute using Supabase CLI
-            result = subprocess.run([
-                'supabase', 'db', 'exec', '--file', temp_file
-            ], capture_output=True, text=True)
-            
-            # Clean up
-            os.remove(temp_file)
+            with self.pool.connection() as conn:
+                with conn.transaction():
+                    with conn.cursor() as cur:
+                        cur.executemany(sql, rows)
             
-            if result.returncode == 0:
-                print(f"✅ SQL executed successfully")
-                return True
-            else:
-                print(f"❌ SQL execution failed: {result.stderr}")
-                return False
+            print(f"✅ SQL executed successfully")
+            return True
                 
         except Exception as e:
             print(f"❌ Error executing SQL: {e}")
             return False
     
-    def migrate_documents_batch(self, docs: List[Dict], batch_size: int = 10) -> int:
-        """Migrate documents in batches"""
-        total_migrated = 0
+    def _insert_batch(self, batch_number: int, batch: List[Dict]):
+        """Insert one batch of documents on a pooled connection"""
+        # Batches queued behind a failure are not started
+        if self.migration_failed.is_set():
+            return
+        rows = [self.document_row(doc) for doc in batch]
         
+        if self.run_sql(DOCUMENT_INSERT_SQL, rows):
+            with self.migrated_lock:
+                self.total_migrated += len(batch)
+                self.completed_batches.add(batch_number)
+                print(f"✅ Batch {batch_number} completed. Total documents migrated: {self.total_migrated}")
+        else:
+            print(f"❌ Batch {batch_number} failed. Stopping migration.")
+            self.migration_failed.set()
+    
+    def migrate_documents_batch(self, docs: Iterable[Dict], batch_size: int = 10) -> int:
+        """Migrate documents in concurrent batches, holding only a few batches in memory"""
         # Skip first document (already migrated)
-        remaining_docs = docs[1:]
+        remaining_docs = iter(docs)
+        next(remaining_docs, None)
         
-        for i in range(0, len(remaining_docs), batch_size):
-            batch = remaining_docs[i:i + batch_size]
-            print(f"\n📄 Migrating document batch {i//batch_size + 1} ({len(batch)} documents)...")
-            
-            sql_statements = []
-            for doc in batch:
-                sql = f"""
-INSERT INTO medical_documents (title, content, source, topic, url, document_type, metadata, content_length)
-VALUES (
-    '{doc['title'].replace("'", "''")}',
-    '{doc['content'].replace("'", "''")}',
-    '{doc['source']}',
-    '{doc['topic']}',
-    '{doc['url']}',
-    '{doc['document_type']}',
-    '{json.dumps(doc['metadata']).replace("'", "''")}',
-    {doc['content_length']}
-);"""
-                sql_statements.append(sql)
-            
-            combined_sql = '\n'.join(sql_statements)
+        batch_number = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=MIGRATION_WORKERS) as executor:
+            while not self.migration_failed.is_set():
+                batch = list(islice(remaining_docs, batch_size))
+                if not batch:
+                    break
+                batch_number += 1
+                print(f"\n📄 Migrating document batch {batch_number} ({len(batch)} documents)...")
+                pending.add(executor.submit(self._insert_batch, batch_number, batch))
+                
+                # Stop reading ahead while every worker already has a batch queued
+                if len(pending) >= MIGRATION_WORKERS * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
             
-            if self.run_supabase_command(combined_sql):
-                total_migrated += len(batch)
-                print(f"✅ Batch completed. Total documents migrated: {total_migrated}")
-            else:
-                print(f"❌ Batch failed. Stopping migration.")
-                break
+            if self.migration_failed.is_set():
+                for future in pending:
+                    future.cancel()
+            for future in pending:
+                if not future.cancelled():
+                    future.result()
+        
+        if self.migration_failed.is_set():
+            # Batches commit out of order; only the contiguous prefix is a safe place to resume
+            contiguous = 0
+            while contiguous + 1 in self.completed_batches:
+                contiguous += 1
+            later = sorted(b for b in self.completed_batches if b > contiguous)
+            print(f"⚠️ Batches 1-{contiguous} committed in order: resume after document {contiguous * batch_size + 1} of the file")
+            if later:
+                print(f"⚠️ Batches {later} also committed; skip their documents when resuming")
         
-        return total_migrated
+        return self.total_migrated
     
     def run_migration(self):
         """Execute the complete migration"""
         print("🚀 Starting WellnessGrid RAG System Bulk Migration")
         print("=" * 60)
         
-        # Load documents
-        print("📖 Loading scraped documents...")
-        docs = self.load_scraped_documents()
-        print(f"📊 Found {len(docs)} total documents to process")
+        # Stream documents; the total is only known once the file has been read
+        print("📖 Streaming scraped documents...")
+        docs = self.iter_scraped_documents()
         print(f"📊 Current database state: {self.current_doc_count} docs, {self.current_embedding_count} embeddings")
         
         # Migrate documents
@@ -135,10 +155,12 @@ VALUES (
         print("📊 MIGRATION SUMMARY")
         print("=" * 60)
         print(f"📄 Documents migrated: {migrated_docs}")
-        print(f"📄 Total documents expected: {len(docs)}")
-        print(f"📊 Target reached: {((self.current_doc_count + migrated_docs) / len(docs)) * 100:.1f}%")
+        print(f"📄 Total documents read: {self.documents_read}")
+        # documents_read only covers the whole file when the migration did not stop early
+        if self.documents_read and not self.migration_failed.is_set():
+            print(f"📊 Target reached: {((self.current_doc_count + migrated_docs) / self.documents_read) * 100:.1f}%")
         
-        if migrated_docs > 0:
+        if migrated_docs > 0 and not self.migration_failed.is_set():
             print("\n✅ Migration completed successfully!")
             print("📝 Note: Embeddings will be processed separately to ensure proper UUID references")
         else:
@@ -146,4 +168,7 @@ VALUES (
 
 if __name__ == "__main__":
     migrator = BulkMigrator()
-    migrator.run_migration() 
\ No newline at end of file
+    try:
+        migrator.run_migration()
+    finally:
+        migrator.pool.close() 
\ No newline at end of file
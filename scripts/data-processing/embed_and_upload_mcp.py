@@ -7,23 +7,63 @@ Embed and Upload Medical Documents to Supabase via MCP
 - Monitor progress and provide detailed reporting
 """
 
+import glob
 import json
 import logging
+import os
+import queue
+import threading
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import asyncio
+import csv
 
 try:
     from sentence_transformers import SentenceTransformer
+    import numpy as np
     import torch
 except ImportError:
     print("Please install required packages:")
-    print("pip install sentence-transformers torch")
+    print("pip install sentence-transformers numpy torch")
     exit(1)
 
+# Optional psycopg for looking up documents that are already in Supabase
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+# Optional orjson for reading scraped files and writing previews (C parser/encoder, NumPy aware)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional ONNX Runtime backend for embeddings (fused kernels, exported once and reused across runs)
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Optional Numba JIT for the chunk-boundary loop (compiled once, cached on disk across runs)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+EMBEDDING_MODEL_NAME = 'NeuML/pubmedbert-base-embeddings'
+ONNX_MODEL_DIR = os.environ.get('PUBMEDBERT_ONNX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pubmedbert_onnx'))
+ENCODE_QUEUE_CHUNKS = 256  # chunks handed to the encoder thread per queue item
+BATCH_SIZE_CANDIDATES = (128, 96, 64, 48, 32, 16)  # GPU encode batch sizes probed, largest first
+VECTOR_FORMAT_ROWS = 1024  # embeddings formatted per vectorized call when writing COPY files
+COPY_FILE_BUFFER = 1 << 20  # 1 MiB write buffer: one write syscall per ~MiB of rows
+EMBEDDINGS_PATH = os.environ.get('MCP_EMBEDDINGS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcp_embeddings.npy'))
+EMBEDDING_CACHE_PATH = os.environ.get('MCP_EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcp_embedding_cache.npz'))
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -35,7 +75,13 @@ class MedicalDocumentEmbedder:
         self.scraped_file = scraped_file
         self.embedding_model = None
         self.device = None
+        self.num_gpus = 0
+        self.encode_pool = None  # SentenceTransformer multi-process pool when several GPUs are used
         self.embedding_dimension = 768  # PubMedBERT
+        self.batch_size = 16  # encode batch size; calibrated against free GPU memory for PyTorch
+        self.embedding_cache: Dict[bytes, tuple] = {}  # chunk hash -> (int8 embedding, scale)
+        self.embeddings: Optional[np.ndarray] = None  # int8 memmap, one row per chunk entry
+        self.embedding_scales: Optional[np.ndarray] = None  # float32 scale of each memmap row
         
         # Processing statistics
         self.stats = {
@@ -43,6 +89,8 @@ class MedicalDocumentEmbedder:
             'documents_processed': 0,
             'chunks_created': 0,
             'embeddings_generated': 0,
+            'cached_embeddings': 0,
+            'documents_already_uploaded': 0,
             'documents_uploaded': 0,
             'embeddings_uploaded': 0,
             'processing_errors': 0,
@@ -61,15 +109,38 @@ class MedicalDocumentEmbedder:
         try:
             # Check device
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            logger.info(f"🔧 Using device: {self.device}")
+            self.num_gpus = torch.cuda.device_count() if self.device.type == 'cuda' else 0
+            logger.info(f"🔧 Using device: {self.device} ({self.num_gpus} GPUs available)")
             
-            # Load model
-            model_name = 'NeuML/pubmedbert-base-embeddings'
-            self.embedding_model = SentenceTransformer(model_name, device=self.device)
+            self.batch_size = 64 if self.device.type == 'cuda' else 16
             
-            # Verify dimension
-            test_embedding = self.embedding_model.encode(["test text"])
-            actual_dim = len(test_embedding[0])
+            # CPU matmuls default to a fraction of the cores; use all of them
+            if self.device.type == 'cpu':
+                torch.set_num_threads(os.cpu_count() or 8)
+            
+            # Load model, preferring ONNX Runtime when it is installed
+            if ort is not None:
+                self.embedding_model = self.load_onnx_embedding_model()
+            if self.embedding_model is None:
+                self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=self.device)
+                
+                # fp16 weights halve memory traffic and use tensor cores on GPU
+                if self.device.type == 'cuda':
+                    self.embedding_model.half()
+                    
+                    # A single GPU encodes in this process; compile before calibration so the
+                    # probes run (and warm up) the compiled graph
+                    if self.num_gpus == 1:
+                        self.compile_embedding_model()
+                    self.batch_size = self.calibrate_batch_size()
+                
+                # One encoder process per GPU; each queued batch is split across them
+                if self.num_gpus > 1:
+                    self.encode_pool = self.embedding_model.start_multi_process_pool()
+                    logger.info(f"🚀 Encoding on {self.num_gpus} GPUs")
+            
+            # Verify dimension from the model config (no forward pass needed)
+            actual_dim = self.embedding_model.get_sentence_embedding_dimension()
             
             if actual_dim != self.embedding_dimension:
                 logger.warning(f"Dimension mismatch: expected {self.embedding_dimension}, got {actual_dim}")
@@ -81,13 +152,92 @@ class MedicalDocumentEmbedder:
             logger.error(f"❌ Failed to setup embedding model: {str(e)}")
             raise
     
+    def compile_embedding_model(self):
+        """Compile the PubMedBERT transformer with torch.compile, keeping eager mode if it fails"""
+        transformer = self.embedding_model[0]
+        eager_model = transformer.auto_model
+        try:
+            logger.info("⚙️ Compiling PubMedBERT encoder...")
+            # Length-sorted batches pad to a different length each time, so compile with
+            # dynamic shapes rather than capturing a CUDA graph per sequence length
+            transformer.auto_model = torch.compile(eager_model, dynamic=True)
+            
+            # Compilation is lazy: trigger it here so failures fall back instead of surfacing mid-run
+            self.embedding_model.encode(["warmup"] * 2)
+            logger.info("✅ PubMedBERT encoder compiled")
+        except Exception as e:
+            logger.warning(f"⚠️ torch.compile unavailable for PubMedBERT, using eager mode: {str(e)}")
+            transformer.auto_model = eager_model
+    
+    def calibrate_batch_size(self) -> int:
+        """Largest batch of max-length inputs that encodes without running out of GPU memory"""
+        free_bytes, total_bytes = torch.cuda.mem_get_info(self.device)
+        logger.info(f"🔧 GPU memory: {free_bytes / 2**30:.1f} GiB free of {total_bytes / 2**30:.1f} GiB")
+        
+        # Every probe input is truncated to max_seq_length tokens: the worst-case padding
+        probe_text = 'x ' * self.embedding_model.max_seq_length
+        for batch_size in BATCH_SIZE_CANDIDATES:
+            try:
+                self.embedding_model.encode([probe_text] * batch_size, batch_size=batch_size)
+                logger.info(f"📏 Encode batch size: {batch_size}")
+                return batch_size
+            except torch.cuda.OutOfMemoryError:
+                torch.cuda.empty_cache()
+        
+        return BATCH_SIZE_CANDIDATES[-1]
+    
+    def load_onnx_embedding_model(self) -> Optional[SentenceTransformer]:
+        """Load PubMedBERT on ONNX Runtime, exporting it to ONNX_MODEL_DIR on the first run"""
+        available = ort.get_available_providers()
+        provider = 'CUDAExecutionProvider' if 'CUDAExecutionProvider' in available else 'CPUExecutionProvider'
+        exported = bool(glob.glob(os.path.join(ONNX_MODEL_DIR, '**', '*.onnx'), recursive=True))
+        
+        try:
+            if not exported:
+                logger.info(f"📦 Exporting PubMedBERT to ONNX in {ONNX_MODEL_DIR} (one-time)...")
+            model = SentenceTransformer(
+                ONNX_MODEL_DIR if exported else EMBEDDING_MODEL_NAME,
+                device=self.device,
+                backend='onnx',
+                model_kwargs={'provider': provider}
+            )
+            if not exported:
+                model.save(ONNX_MODEL_DIR)
+            
+            logger.info(f"⚡ Using ONNX Runtime backend ({provider})")
+            return model
+            
+        except Exception as e:
+            logger.warning(f"⚠️ ONNX Runtime unavailable for PubMedBERT, using PyTorch: {str(e)}")
+            return None
+    
+    def fetch_existing_content_hashes(self) -> set:
+        """content_hash of every document already in Supabase (empty when SUPABASE_DB_URL is unset)"""
+        db_url = os.environ.get("SUPABASE_DB_URL")
+        if not db_url or psycopg is None:
+            logger.info("ℹ️ SUPABASE_DB_URL not set (or psycopg missing), embedding all documents")
+            return set()
+        
+        try:
+            with psycopg.connect(db_url) as conn:
+                rows = conn.execute("SELECT content_hash FROM medical_documents WHERE content_hash IS NOT NULL AND content_hash <> ''").fetchall()
+            logger.info(f"🔎 Found {len(rows)} documents already in Supabase")
+            return {row[0] for row in rows}
+        except Exception as e:
+            logger.warning(f"⚠️ Could not fetch existing documents, embedding all: {str(e)}")
+            return set()
+    
     def load_scraped_documents(self) -> List[Dict[str, Any]]:
         """Load documents from scraped JSON file"""
         logger.info(f"📄 Loading documents from: {self.scraped_file}")
         
         try:
-            with open(self.scraped_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if orjson is not None:
+                with open(self.scraped_file, 'rb') as f:
+                    data = orjson.loads(f.read())
+            else:
+                with open(self.scraped_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
             
             documents = data.get('documents', [])
             self.stats['documents_loaded'] = len(documents)
@@ -99,182 +249,240 @@ class MedicalDocumentEmbedder:
             logger.error(f"❌ Failed to load documents: {str(e)}")
             raise
     
-    def create_text_chunks(self, text: str, chunk_size: int = 800, overlap: int = 150) -> List[str]:
+    @staticmethod
+    def create_text_chunks(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str]:
         """Create overlapping text chunks for better embeddings"""
         if len(text) <= chunk_size:
             return [text]
         
-        chunks = []
-        start = 0
+        # Offsets of every period, found in one vectorized scan (UTF-32 keeps one code unit per character;
+        # surrogatepass keeps lone surrogates from JSON input encodable)
+        codepoints = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        periods = np.flatnonzero(codepoints == ord('.'))
         
-        while start < len(text):
-            end = start + chunk_size
-            
-            # Try to break at sentence boundary
-            if end < len(text):
-                sentence_end = text.rfind('.', start + chunk_size - 200, end)
-                if sentence_end > start:
-                    end = sentence_end + 1
-            
+        chunks = []
+        for start, end in chunk_offsets(periods, len(text), chunk_size, overlap):
             chunk = text[start:end].strip()
             if chunk and len(chunk) > 50:  # Only meaningful chunks
                 chunks.append(chunk)
-            
-            start = end - overlap
-            if start >= len(text):
-                break
         
         return chunks
     
-    def generate_document_id(self, doc: Dict[str, Any]) -> str:
+    @staticmethod
+    def embedding_key(chunk_text: str) -> bytes:
+        """Hash of the chunk text, keyed by model so vectors from another model are never reused"""
+        return hashlib.blake2b(chunk_text.encode('utf-8'), digest_size=16, key=EMBEDDING_MODEL_NAME.encode()).digest()
+    
+    def load_embedding_cache(self):
+        """Load embeddings saved by earlier runs from EMBEDDING_CACHE_PATH"""
+        if not os.path.exists(EMBEDDING_CACHE_PATH):
+            return
+        
+        try:
+            with np.load(EMBEDDING_CACHE_PATH) as data:
+                if 'scales' in data:
+                    embeddings, scales = data['embeddings'], data['scales']
+                elif data['embeddings'].dtype == np.int8:
+                    # Written before scales were kept: the magnitudes cannot be recovered
+                    logger.warning("⚠️ Ignoring embedding cache without per-vector scales")
+                    return
+                else:
+                    embeddings, scales = quantize_embeddings(data['embeddings'])
+                self.embedding_cache = {
+                    key.tobytes(): (embedding, scale) for key, embedding, scale in zip(data['keys'], embeddings, scales)
+                }
+            logger.info(f"💾 Loaded {len(self.embedding_cache)} cached embeddings")
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable embedding cache: {str(e)}")
+    
+    def save_embedding_cache(self):
+        """Persist the embedding cache to EMBEDDING_CACHE_PATH for the next run"""
+        if not self.embedding_cache:
+            return
+        
+        keys = np.frombuffer(b''.join(self.embedding_cache), dtype=np.uint8).reshape(-1, 16)
+        embeddings = np.stack([embedding for embedding, _ in self.embedding_cache.values()])
+        scales = np.array([scale for _, scale in self.embedding_cache.values()], dtype=np.float32)
+        np.savez(EMBEDDING_CACHE_PATH, keys=keys, embeddings=embeddings, scales=scales)
+        logger.info(f"💾 Saved {len(keys)} embeddings to cache")
+    
+    @staticmethod
+    def generate_document_id(doc: Dict[str, Any]) -> str:
         """Generate consistent document ID"""
         content = f"{doc.get('url', '')}{doc.get('title', '')}{doc.get('source', '')}"
-        return hashlib.md5(content.encode()).hexdigest()
+        # 128-bit BLAKE2b keeps the 32-character hex ID format and hashes faster than MD5
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
     
-    def process_documents_to_embeddings(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Process documents into embeddings with chunking"""
+    def process_documents_to_embeddings(self, documents: List[Dict[str, Any]]) -> tuple:
+        """Process documents into (documents_list, embeddings_list), chunking on this thread while another encodes"""
         logger.info(f"🔢 Processing {len(documents)} documents into embeddings...")
         
-        embedding_data = []
-        
-        for i, doc in enumerate(documents):
-            if i % 25 == 0:
-                logger.info(f"📊 Processing document {i+1}/{len(documents)}")
-            
-            try:
-                # Generate document ID
-                doc_id = self.generate_document_id(doc)
-                
-                # Create chunks
-                content = doc.get('content', '')
-                if not content or len(content) < 100:
-                    logger.debug(f"Skipping document with insufficient content: {doc.get('title', 'Unknown')}")
-                    continue
-                
-                chunks = self.create_text_chunks(content)
-                self.stats['chunks_created'] += len(chunks)
+        # Upload rows are built in this single pass: one document entry per doc_id,
+        # one embedding entry per chunk
+        documents_map = {}
+        embeddings_list = []
+        self.load_embedding_cache()
+        
+        # Every row from this run shares one timestamp instead of a datetime.now() per row
+        created_at = datetime.now().isoformat()
+        
+        # Vectors are written straight to a memory-mapped .npy (entries only keep their row), so
+        # peak RSS no longer grows with the corpus. Each chunk advances at least 451 characters,
+        # which bounds the row count.
+        estimated_chunks = sum(len(doc.get('content') or '') // 450 + 1 for doc in documents)
+        self.embeddings = np.lib.format.open_memmap(
+            EMBEDDINGS_PATH, mode='w+', dtype=np.int8, shape=(estimated_chunks, self.embedding_dimension)
+        )
+        self.embedding_scales = np.empty(estimated_chunks, dtype=np.float32)
+        batch_size = self.batch_size
+        
+        # Bounded queue: chunking stays a few batches ahead of the encoder without buffering everything
+        encode_queue = queue.Queue(maxsize=8)
+        encode_errors = []
+        
+        def encode_worker():
+            while True:
+                batch = encode_queue.get()
+                if batch is None:
+                    break
+                if encode_errors:
+                    continue  # keep draining so the producer never blocks
                 
-                # Process each chunk
-                for chunk_idx, chunk_text in enumerate(chunks):
-                    try:
-                        # Generate embedding
-                        embedding = self.embedding_model.encode([chunk_text])[0].tolist()
-                        self.stats['embeddings_generated'] += 1
+                try:
+                    # Boilerplate (disclaimers, footers) repeats across pages: only chunks not seen
+                    # before, in this run or an earlier one, go through the model
+                    keys = [self.embedding_key(chunk_text) for _, _, chunk_text in batch]
+                    missing = {key: chunk_text for key, (_, _, chunk_text) in zip(keys, batch) if key not in self.embedding_cache}
+                    
+                    if missing:
+                        # encode() length-sorts each batch's texts and restores input order, so every
+                        # mini-batch only pads to its own longest chunk (no manual sort/un-permute needed)
+                        if self.encode_pool is not None:
+                            embeddings = self.embedding_model.encode_multi_process(
+                                list(missing.values()),
+                                self.encode_pool,
+                                batch_size=batch_size,
+                                chunk_size=-(-len(missing) // self.num_gpus)
+                            )
+                        else:
+                            embeddings = self.embedding_model.encode(
+                                list(missing.values()),
+                                batch_size=batch_size,
+                                convert_to_numpy=True
+                            )
+                        self.embedding_cache.update(zip(missing, zip(*quantize_embeddings(embeddings))))
+                    
+                    self.stats['embeddings_generated'] += len(batch)
+                    self.stats['cached_embeddings'] += len(batch) - len(missing)
+                    
+                    for (doc_id, chunk_idx, chunk_text), key in zip(batch, keys):
+                        row = len(embeddings_list)
+                        embedding, scale = self.embedding_cache[key]
+                        self.embeddings[row] = embedding
+                        self.embedding_scales[row] = scale
+                        if key in missing:
+                            # Point the cache at the disk-backed row so the batch array can be freed
+                            self.embedding_cache[key] = (self.embeddings[row], scale)
+                            del missing[key]
                         
-                        # Prepare data for upload
-                        embedding_entry = {
+                        embeddings_list.append({
+                            'id': str(uuid.uuid4()),
                             'document_id': doc_id,
                             'chunk_index': chunk_idx,
                             'chunk_content': chunk_text,
-                            'embedding': embedding,
-                            'document_metadata': {
-                                'title': doc.get('title', ''),
-                                'source': doc.get('source', ''),
-                                'topic': doc.get('topic', ''),
-                                'url': doc.get('url', ''),
-                                'document_type': doc.get('document_type', 'medical_information'),
-                                'category': doc.get('category', 'unknown'),
-                                'scraped_date': doc.get('scraped_date', ''),
-                                'chunk_count': len(chunks),
-                                'content_hash': doc.get('content_hash', ''),
-                                'word_count': doc.get('word_count', 0)
-                            }
-                        }
-                        
-                        embedding_data.append(embedding_entry)
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Failed to generate embedding for chunk {chunk_idx}: {str(e)}")
-                        self.stats['processing_errors'] += 1
-                        continue
+                            'embedding_row': row,
+                            'created_at': created_at
+                        })
+                except Exception as e:
+                    encode_errors.append(e)
+        
+        encoder = threading.Thread(target=encode_worker, name='chunk-encoder', daemon=True)
+        encoder.start()
+        
+        # Chunk on this thread; chunking is cheap string slicing, and the encoder thread already
+        # overlaps it with model compute. A process pool would re-import torch in every worker.
+        pending = []
+        try:
+            for i, result in enumerate(chunk_document(doc, created_at) for doc in documents):
+                if i % 25 == 0:
+                    logger.info(f"📊 Processing document {i+1}/{len(documents)}")
                 
+                if result is None:
+                    continue  # insufficient content
+                if isinstance(result, Exception):
+                    logger.error(f"❌ Failed to process document: {str(result)}")
+                    self.stats['processing_errors'] += 1
+                    continue
+                
+                doc_id, chunks, document = result
+                self.stats['chunks_created'] += len(chunks)
                 self.stats['documents_processed'] += 1
+                if not chunks:
+                    continue
                 
-            except Exception as e:
-                logger.error(f"❌ Failed to process document {i}: {str(e)}")
-                self.stats['processing_errors'] += 1
-                continue
+                # Documents sharing an ID (same url/title/source) are merged, first metadata wins
+                if doc_id in documents_map:
+                    documents_map[doc_id]['content'] += ' ' + document['content']
+                else:
+                    documents_map[doc_id] = document
+                pending.extend((doc_id, chunk_idx, chunk_text) for chunk_idx, chunk_text in enumerate(chunks))
+                
+                # Larger queue items when several GPUs share each encode call
+                if len(pending) >= ENCODE_QUEUE_CHUNKS * max(1, self.num_gpus):
+                    encode_queue.put(pending)
+                    pending = []
+            
+            if pending:
+                encode_queue.put(pending)
+        finally:
+            encode_queue.put(None)
+            encoder.join()
+        
+        if encode_errors:
+            logger.error(f"❌ Failed to generate embeddings: {str(encode_errors[0])}")
+            raise encode_errors[0]
+        
+        self.embeddings.flush()
+        self.save_embedding_cache()
         
-        logger.info(f"✅ Generated {len(embedding_data)} embeddings from {self.stats['documents_processed']} documents")
-        return embedding_data
+        documents_list = list(documents_map.values())
+        logger.info(f"✅ Generated {len(embeddings_list)} embeddings from {self.stats['documents_processed']} documents")
+        logger.info(f"📊 Prepared {len(documents_list)} documents and {len(embeddings_list)} embeddings")
+        return documents_list, embeddings_list
     
-    def save_embeddings_preview(self, embedding_data: List[Dict[str, Any]]) -> str:
+    def embedding_vectors(self, rows: List[int]) -> np.ndarray:
+        """Float32 embeddings of the given memmap rows, rescaled from their int8 storage"""
+        return dequantize_embeddings(self.embeddings[rows], self.embedding_scales[rows])
+    
+    def save_embeddings_preview(self, embeddings_list: List[Dict[str, Any]]) -> str:
         """Save a preview of embeddings for verification"""
         preview_file = f"scripts/data-processing/embeddings_preview_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
         # Create preview with first 5 entries (excluding large embedding vectors)
         preview_data = []
-        for entry in embedding_data[:5]:
+        for entry in embeddings_list[:5]:
             preview_entry = entry.copy()
-            preview_entry['embedding'] = f"[768D vector: {entry['embedding'][:3]}...{entry['embedding'][-3:]}]"
+            embedding = self.embedding_vectors([entry['embedding_row']])[0]
+            preview_entry['embedding'] = f"[768D vector: {embedding[:3].tolist()}...{embedding[-3:].tolist()}]"
             preview_data.append(preview_entry)
         
         preview = {
-            'total_embeddings': len(embedding_data),
+            'total_embeddings': len(embeddings_list),
             'embedding_dimension': self.embedding_dimension,
             'created_at': datetime.now().isoformat(),
             'preview_entries': preview_data
         }
         
-        with open(preview_file, 'w', encoding='utf-8') as f:
-            json.dump(preview, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(preview_file, 'wb') as f:
+                f.write(orjson.dumps(preview, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(preview_file, 'w', encoding='utf-8') as f:
+                json.dump(preview, f, indent=2, ensure_ascii=False)
         
         logger.info(f"💾 Embeddings preview saved: {preview_file}")
         return preview_file
     
-    def prepare_for_mcp_upload(self, embedding_data: List[Dict[str, Any]]) -> tuple:
-        """Prepare documents and embeddings for MCP upload"""
-        logger.info("📋 Preparing data for MCP upload...")
-        
-        # Group by document for efficient upload
-        documents_map = {}
-        embeddings_list = []
-        
-        for entry in embedding_data:
-            doc_id = entry['document_id']
-            
-            # Prepare document entry (one per document)
-            if doc_id not in documents_map:
-                metadata = entry['document_metadata']
-                documents_map[doc_id] = {
-                    'id': doc_id,
-                    'title': metadata['title'],
-                    'content': '',  # Will be built from chunks
-                    'source': metadata['source'],
-                    'topic': metadata['topic'],
-                    'url': metadata['url'],
-                    'document_type': metadata['document_type'],
-                    'category': metadata['category'],
-                    'scraped_date': metadata['scraped_date'],
-                    'content_hash': metadata['content_hash'],
-                    'word_count': metadata['word_count'],
-                    'created_at': datetime.now().isoformat(),
-                    'embedding_date': datetime.now().isoformat()
-                }
-            
-            # Add chunk content to document
-            documents_map[doc_id]['content'] += entry['chunk_content'] + ' '
-            
-            # Prepare embedding entry
-            embedding_entry = {
-                'id': str(uuid.uuid4()),
-                'document_id': doc_id,
-                'chunk_index': entry['chunk_index'],
-                'chunk_content': entry['chunk_content'],
-                'embedding': entry['embedding'],
-                'created_at': datetime.now().isoformat()
-            }
-            embeddings_list.append(embedding_entry)
-        
-        # Clean up document content
-        for doc in documents_map.values():
-            doc['content'] = doc['content'].strip()
-        
-        documents_list = list(documents_map.values())
-        
-        logger.info(f"📊 Prepared {len(documents_list)} documents and {len(embeddings_list)} embeddings")
-        return documents_list, embeddings_list
-    
     async def run_embedding_pipeline(self) -> Dict[str, Any]:
         """Run the complete embedding and upload pipeline"""
         self.stats['start_time'] = time.time()
@@ -288,16 +496,21 @@ class MedicalDocumentEmbedder:
             # Step 2: Load scraped documents
             documents = self.load_scraped_documents()
             
-            # Step 3: Generate embeddings
-            embedding_data = self.process_documents_to_embeddings(documents)
+            # Skip documents whose content is already in Supabase (incremental runs)
+            existing_hashes = self.fetch_existing_content_hashes()
+            if existing_hashes:
+                new_documents = [doc for doc in documents if doc.get('content_hash') not in existing_hashes]
+                self.stats['documents_already_uploaded'] = len(documents) - len(new_documents)
+                logger.info(f"⏭️ Skipping {self.stats['documents_already_uploaded']} documents already in Supabase")
+                documents = new_documents
             
-            # Step 4: Save preview
-            preview_file = self.save_embeddings_preview(embedding_data)
+            # Step 3: Generate embeddings and upload rows
+            documents_list, embeddings_list = self.process_documents_to_embeddings(documents)
             
-            # Step 5: Prepare for MCP
-            documents_list, embeddings_list = self.prepare_for_mcp_upload(embedding_data)
+            # Step 4: Save preview
+            preview_file = self.save_embeddings_preview(embeddings_list)
             
-            # Step 6: Print MCP commands for manual execution
+            # Step 5: Print MCP commands for manual execution
             self.print_mcp_commands(documents_list, embeddings_list)
             
             # Final statistics
@@ -311,6 +524,8 @@ class MedicalDocumentEmbedder:
                 'documents_processed': self.stats['documents_processed'],
                 'chunks_created': self.stats['chunks_created'],
                 'embeddings_generated': self.stats['embeddings_generated'],
+                'cached_embeddings': self.stats['cached_embeddings'],
+                'documents_already_uploaded': self.stats['documents_already_uploaded'],
                 'processing_errors': self.stats['processing_errors'],
                 'embedding_dimension': self.embedding_dimension,
                 'device_used': str(self.device),
@@ -324,6 +539,11 @@ class MedicalDocumentEmbedder:
         except Exception as e:
             logger.error(f"❌ Embedding pipeline failed: {str(e)}")
             raise
+        
+        finally:
+            if self.encode_pool is not None:
+                self.embedding_model.stop_multi_process_pool(self.encode_pool)
+                self.encode_pool = None
     
     def print_mcp_commands(self, documents_list: List[Dict], embeddings_list: List[Dict]):
         """Print MCP commands for manual execution"""
@@ -341,8 +561,8 @@ class MedicalDocumentEmbedder:
         
         # Sample embeddings
         logger.info(f"\n🔸 Sample embedding insertions (first 2):")
-        for i, emb in enumerate(embeddings_list[:2]):
-            vector_str = '[' + ','.join(map(str, emb['embedding'])) + ']'
+        sample_vectors = format_vectors(self.embedding_vectors([emb['embedding_row'] for emb in embeddings_list[:2]]))
+        for i, (emb, vector_str) in enumerate(zip(embeddings_list[:2], sample_vectors)):
             print(f"\n-- Embedding {i+1} for document")
             print("INSERT INTO document_embeddings (id, document_id, chunk_index, chunk_content, embedding, created_at)")
             chunk_safe = emb['chunk_content'][:50].replace("'", "''")
@@ -353,48 +573,132 @@ class MedicalDocumentEmbedder:
         logger.info(f"   🔢 Embeddings: {len(embeddings_list)}")
         logger.info(f"   📐 Embedding dimension: {self.embedding_dimension}")
         
-        # Save batch files for easier upload
-        self.save_batch_sql_files(documents_list, embeddings_list)
+        # Save COPY files for bulk upload
+        self.save_copy_files(documents_list, embeddings_list)
     
-    def save_batch_sql_files(self, documents_list: List[Dict], embeddings_list: List[Dict]):
-        """Save SQL batch files for upload"""
+    def save_copy_files(self, documents_list: List[Dict], embeddings_list: List[Dict]):
+        """Save COPY-ready TSV files and a psql loader script for upload"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Documents SQL
-        docs_file = f"scripts/database/new_documents_{timestamp}.sql"
-        with open(docs_file, 'w', encoding='utf-8') as f:
-            f.write("-- Medical Documents Batch Insert\n")
+        docs_file = os.path.abspath(f"scripts/database/new_documents_{timestamp}.tsv")
+        embeddings_file = os.path.abspath(f"scripts/database/new_embeddings_{timestamp}.tsv")
+        
+        # Both tables are written concurrently; file writes release the GIL
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(self.write_documents_tsv, docs_file, documents_list),
+                executor.submit(self.write_embeddings_tsv, embeddings_file, embeddings_list)
+            ]
+            for future in futures:
+                future.result()
+        
+        # psql's client-side \copy streams the local files to the server
+        # csv.writer leaves '' unquoted, which COPY would read as NULL; FORCE_NOT_NULL keeps text columns ''
+        load_file = f"scripts/database/load_new_data_{timestamp}.sql"
+        with open(load_file, 'w', encoding='utf-8') as f:
+            f.write("-- Medical Documents and Embeddings Bulk Load (run with psql)\n")
             f.write(f"-- Generated: {datetime.now().isoformat()}\n")
-            f.write(f"-- Total documents: {len(documents_list)}\n\n")
-            
-            for doc in documents_list:
-                content_safe = doc['content'].replace("'", "''").replace('\n', ' ').replace('\r', '')[:2000]
-                title_safe = doc['title'].replace("'", "''")
-                
-                f.write(f"INSERT INTO medical_documents (id, title, content, source, topic, url, document_type, category, scraped_date, content_hash, word_count, created_at, embedding_date) VALUES ")
-                f.write(f"('{doc['id']}', '{title_safe}', '{content_safe}', '{doc['source']}', '{doc['topic']}', '{doc['url']}', '{doc['document_type']}', '{doc['category']}', '{doc['scraped_date']}', '{doc['content_hash']}', {doc['word_count']}, '{doc['created_at']}', '{doc['embedding_date']}');\n")
-        
-        # Embeddings SQL (in batches)
-        batch_size = 100
-        for batch_idx in range(0, len(embeddings_list), batch_size):
-            batch = embeddings_list[batch_idx:batch_idx + batch_size]
-            batch_file = f"scripts/database/new_embeddings_batch_{batch_idx//batch_size + 1}_{timestamp}.sql"
-            
-            with open(batch_file, 'w', encoding='utf-8') as f:
-                f.write(f"-- Medical Document Embeddings Batch {batch_idx//batch_size + 1}\n")
-                f.write(f"-- Generated: {datetime.now().isoformat()}\n")
-                f.write(f"-- Embeddings: {len(batch)}\n\n")
-                
-                for emb in batch:
-                    vector_str = '[' + ','.join(map(str, emb['embedding'])) + ']'
-                    content_safe = emb['chunk_content'].replace("'", "''").replace('\n', ' ').replace('\r', '')
-                    
-                    f.write(f"INSERT INTO document_embeddings (id, document_id, chunk_index, chunk_content, embedding, created_at) VALUES ")
-                    f.write(f"('{emb['id']}', '{emb['document_id']}', {emb['chunk_index']}, '{content_safe}', '{vector_str}', '{emb['created_at']}');\n")
+            f.write(f"-- Total documents: {len(documents_list)}, embeddings: {len(embeddings_list)}\n\n")
+            f.write(f"\\copy medical_documents (id, title, content, source, topic, url, document_type, category, scraped_date, content_hash, word_count, created_at, embedding_date) FROM '{docs_file}' WITH (FORMAT csv, DELIMITER E'\\t', FORCE_NOT_NULL (title, content, source, topic, url, document_type, category, content_hash))\n")
+            f.write(f"\\copy document_embeddings (id, document_id, chunk_index, chunk_content, embedding, created_at) FROM '{embeddings_file}' WITH (FORMAT csv, DELIMITER E'\\t', FORCE_NOT_NULL (chunk_content))\n")
         
-        logger.info(f"💾 SQL batch files saved:")
+        logger.info(f"💾 COPY files saved:")
         logger.info(f"   📄 Documents: {docs_file}")
-        logger.info(f"   🔢 Embeddings: {len(embeddings_list)//batch_size + 1} batch files")
+        logger.info(f"   🔢 Embeddings: {embeddings_file}")
+        logger.info(f"   📜 Loader: psql \"$SUPABASE_DB_URL\" -f {load_file}")
+    
+    def write_documents_tsv(self, path: str, documents_list: List[Dict]):
+        """Write document rows as a tab-delimited CSV file for COPY"""
+        # One bulk COPY per table is parsed far faster than a per-row INSERT statement;
+        # CSV quoting handles embedded quotes, tabs and newlines without manual escaping
+        with open(path, 'w', encoding='utf-8', newline='', buffering=COPY_FILE_BUFFER) as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerows(
+                [
+                    doc['id'], doc['title'], doc['content'][:2000], doc['source'], doc['topic'], doc['url'],
+                    doc['document_type'], doc['category'], doc['scraped_date'], doc['content_hash'],
+                    doc['word_count'], doc['created_at'], doc['embedding_date']
+                ]
+                for doc in documents_list
+            )
+    
+    def write_embeddings_tsv(self, path: str, embeddings_list: List[Dict]):
+        """Write embedding rows as a tab-delimited CSV file for COPY"""
+        with open(path, 'w', encoding='utf-8', newline='', buffering=COPY_FILE_BUFFER) as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            for start in range(0, len(embeddings_list), VECTOR_FORMAT_ROWS):
+                # Rows are read lazily from the memmap, one block at a time
+                block = embeddings_list[start:start + VECTOR_FORMAT_ROWS]
+                vector_strs = format_vectors(self.embedding_vectors([emb['embedding_row'] for emb in block]))
+                writer.writerows(
+                    [emb['id'], emb['document_id'], emb['chunk_index'], emb['chunk_content'], vector_str, emb['created_at']]
+                    for emb, vector_str in zip(block, vector_strs)
+                )
+
+def quantize_embeddings(embeddings: np.ndarray) -> tuple:
+    """Symmetric per-vector int8 quantization; returns (int8 rows, float32 scale per row)"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.maximum(np.abs(embeddings).max(axis=-1) / 127.0, np.finfo(np.float32).tiny)
+    return np.round(embeddings / scales[:, None]).astype(np.int8), scales
+
+def dequantize_embeddings(quantized: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Float32 embeddings from int8 rows and their scales; int8 is only the on-disk working format"""
+    return quantized.astype(np.float32) * scales[:, None]
+
+def format_vectors(rows: np.ndarray) -> List[str]:
+    """pgvector text literals for a 2D block of embeddings, formatted by NumPy instead of str() per element"""
+    return ['[' + ','.join(row) + ']' for row in np.char.mod('%.6g', rows).tolist()]
+
+def chunk_offsets(periods, text_len, chunk_size, overlap):
+    """(start, end) of each chunk window, breaking at the last period in the 200 characters before the boundary"""
+    offsets = []
+    start = 0
+    
+    while start < text_len:
+        end = start + chunk_size
+        
+        if end < text_len:
+            idx = np.searchsorted(periods, end) - 1
+            if idx >= 0 and periods[idx] >= start + chunk_size - 200 and periods[idx] > start:
+                end = periods[idx] + 1
+        
+        offsets.append((start, end))
+        start = end - overlap
+    
+    return offsets
+
+if njit is not None:
+    chunk_offsets = njit(cache=True)(chunk_offsets)
+
+def chunk_document(doc: Dict[str, Any], created_at: str):
+    """Chunk one document; returns (doc_id, chunks, document row), None if skipped, or the error"""
+    try:
+        content = doc.get('content', '')
+        if not content or len(content) < 100:
+            return None
+        
+        doc_id = MedicalDocumentEmbedder.generate_document_id(doc)
+        chunks = MedicalDocumentEmbedder.create_text_chunks(content)
+        
+        # Upload row for the document, built once from the source rather than per chunk
+        document = {
+            'id': doc_id,
+            'title': doc.get('title', ''),
+            'content': ' '.join(chunks),
+            'source': doc.get('source', ''),
+            'topic': doc.get('topic', ''),
+            'url': doc.get('url', ''),
+            'document_type': doc.get('document_type', 'medical_information'),
+            'category': doc.get('category', 'unknown'),
+            'scraped_date': doc.get('scraped_date', ''),
+            'content_hash': doc.get('content_hash', ''),
+            'word_count': doc.get('word_count', 0),
+            'created_at': created_at,
+            'embedding_date': created_at
+        }
+        return doc_id, chunks, document
+        
+    except Exception as e:
+        return e
 
 async def main():
     """Main function to run embedding pipeline"""
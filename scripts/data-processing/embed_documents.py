@@ -13,6 +13,9 @@ Usage:
     python embed_documents.py --clear-db    # Clear database and start fresh
     python embed_documents.py               # Process new sources only
     python embed_documents.py --force       # Re-embed everything
+    python embed_documents.py --bootstrap   # Install required packages first
+
+Run embed_worker.py alongside to keep the model loaded between runs.
 """
 
 import os
@@ -20,20 +23,123 @@ import sys
 import json
 import time
 import hashlib
-import requests
-import numpy as np
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Iterator, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
-from tqdm import tqdm
+from urllib.parse import urljoin, urlparse
 import argparse
+import importlib.util
+import secrets
+import sqlite3
+import stat
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+def install_packages():
+    """Install required packages"""
+    print("📦 Installing required packages...")
+    
+    packages = [
+        "torch>=2.6.0",
+        "sentence-transformers",
+        "python-dotenv", 
+        "supabase",
+        "beautifulsoup4",
+        "requests",
+        "numpy",
+        "tqdm"
+    ]
+    
+    for package in packages:
+        try:
+            subprocess.check_call([sys.executable, "-m", "pip", "install", package], 
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            print(f"✅ {package}")
+        except Exception as e:
+            print(f"⚠️ {package}: {e}")
+    
+    print("✅ Package installation complete!")
+
+# --bootstrap installs the third-party packages imported below, so it runs before them
+if __name__ == "__main__" and '--bootstrap' in sys.argv[1:]:
+    install_packages()
+
+import requests
+import numpy as np
+from bs4 import BeautifulSoup
+import soupsieve
+from tqdm import tqdm
+from requests.adapters import HTTPAdapter
 
 # Load environment variables
 from dotenv import load_dotenv
 
+# Optional selectolax (lexbor, C) HTML parser; BeautifulSoup is used when it is missing
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+# Optional on-disk HTTP cache: revalidates with ETag/Last-Modified and reuses bodies on 304 Not Modified
+try:
+    from requests_cache import CachedSession
+except ImportError:
+    CachedSession = None
+
+# Optional direct Postgres connection for bulk COPY of embeddings (falls back to the REST API)
+try:
+    import psycopg
+    from psycopg.types.json import Json
+except ImportError:
+    psycopg = None
+
+# Optional orjson for reading and writing the registry (falls back to the json module)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional ONNX Runtime for int8-quantized CPU inference (PyTorch FP32 is used when it is missing)
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+NIL_UUID = '00000000-0000-0000-0000-000000000000'
+EMBEDDING_MODEL_NAME = 'NeuML/pubmedbert-base-embeddings'
+ONNX_MODEL_DIR = os.environ.get('PUBMEDBERT_ONNX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pubmedbert_onnx'))
+ONNX_QUANTIZATION = 'avx2'  # dynamic int8 config; avx2 kernels also run on AVX-512 CPUs
+# The worker socket and its authkey live in a directory only the current user can open
+EMBED_WORKER_DIR = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), f'wellnessgrid-{os.getuid()}')
+EMBED_WORKER_ADDRESS = os.path.join(EMBED_WORKER_DIR, 'embed_worker.sock')
+EMBED_WORKER_KEY_PATH = os.path.join(EMBED_WORKER_DIR, 'embed_worker.key')
+EMBED_WORKER_CONNECT_TIMEOUT = 10.0  # seconds; the worker serves one client at a time
+EMBED_WORKER_RECV_TIMEOUT = float(os.environ.get('EMBED_WORKER_TIMEOUT', '1800'))  # seconds per encode request
+FETCH_WORKERS = 16  # concurrent source fetches
+HOST_REQUEST_INTERVAL = 2.0  # seconds between requests to the same host
+HTTP_CACHE_PATH = "http_cache"  # requests-cache SQLite file (http_cache.sqlite)
+EXTRACTED_TEXT_CACHE_PATH = "extracted_text_cache.sqlite3"  # page text keyed by response body hash
+EMBEDDING_CACHE_PATH = "embedding_cache.npz"  # float16 chunk embeddings keyed by chunk text hash
+SENTENCE_END_CODEPOINTS = np.array([ord(c) for c in '.!?'], dtype=np.uint32)
+UNWANTED_TAGS = ('script', 'style', 'nav', 'header', 'footer', 'aside')
+CONTENT_SELECTORS = (
+    'main', '[role="main"]', '.main-content', '#main-content',
+    '.content', '#content', 'article', '.article'
+)
+# Compiled once for the BeautifulSoup path; tried in priority order, not document order
+COMPILED_CONTENT_SELECTORS = tuple(soupsieve.compile(selector) for selector in CONTENT_SELECTORS)
+DOCUMENT_INSERT_BATCH = 500  # medical_documents rows per insert request
+EMBEDDING_COPY_SQL = "COPY document_embeddings (document_id, chunk_index, chunk_content, embedding) FROM STDIN"
+DOCUMENT_INSERT_SQL = """
+INSERT INTO medical_documents (title, content, source, topic, url, document_type, metadata, content_length)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+RETURNING id
+"""
+
 def setup_environment():
     """Load environment variables and validate configuration"""
     print("🔧 Setting up environment...")
@@ -64,30 +170,13 @@ def setup_environment():
     print("✅ All Supabase environment variables found")
     return True
 
-def install_packages():
-    """Install required packages"""
-    print("📦 Installing required packages...")
-    
-    packages = [
-        "torch>=2.6.0",
-        "sentence-transformers",
-        "python-dotenv", 
-        "supabase",
-        "beautifulsoup4",
-        "requests",
-        "numpy",
-        "tqdm"
-    ]
-    
-    for package in packages:
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", package], 
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            print(f"✅ {package}")
-        except Exception as e:
-            print(f"⚠️ {package}: {e}")
-    
-    print("✅ Package installation complete!")
+def check_packages() -> bool:
+    """Cheap check that the packages imported lazily at runtime are installed"""
+    missing = [name for name in ('sentence_transformers', 'supabase') if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing packages: {', '.join(missing)} (run with --bootstrap to install)")
+        return False
+    return True
 
 @dataclass
 class DocumentSource:
@@ -106,6 +195,11 @@ class DocumentSource:
     def __post_init__(self):
         if self.api_params is None:
             self.api_params = {}
+    
+    @property
+    def source_id(self) -> str:
+        """Stable registry key for this source"""
+        return f"{self.category}_{self.subcategory}_{hashlib.sha256(self.title.encode()).hexdigest()[:8]}"
 
 @dataclass 
 class EmbeddedDocument:
@@ -123,19 +217,32 @@ class EmbeddedDocument:
 class DocumentRegistry:
     """Manages the embedded documents registry"""
     
-    def __init__(self, registry_path: str = "embedded_registry.json"):
+    def __init__(self, registry_path: str = "embedded_registry.json", sessions_path: str = "embedded_sessions.jsonl"):
         self.registry_path = registry_path
+        self.sessions_path = sessions_path
+        self.sessions = {}
+        self.dirty = False
         self.registry = self._load_registry()
+        
+        # Sessions used to live inside the registry; move them to the append-only log
+        legacy_sessions = self.registry.pop("embedding_sessions", None)
+        if legacy_sessions is not None:
+            for session in legacy_sessions:
+                self._append_session(session)
+            self.dirty = True
     
     def _load_registry(self) -> Dict:
         """Load the registry file"""
         if os.path.exists(self.registry_path):
+            if orjson is not None:
+                with open(self.registry_path, 'rb') as f:
+                    return orjson.loads(f.read())
             with open(self.registry_path, 'r') as f:
                 return json.load(f)
         else:
+            self.dirty = True
             return {
                 "embedded_documents": {},
-                "embedding_sessions": [],
                 "statistics": {
                     "total_documents_embedded": 0,
                     "total_chunks_created": 0,
@@ -153,10 +260,31 @@ class DocumentRegistry:
             }
     
     def save_registry(self):
-        """Save the registry to file"""
+        """Save the registry to file, only if the document map changed"""
+        if not self.dirty:
+            return
+        
         self.registry["metadata"]["last_updated"] = datetime.now().isoformat()
-        with open(self.registry_path, 'w') as f:
-            json.dump(self.registry, f, indent=2)
+        if orjson is not None:
+            with open(self.registry_path, 'wb') as f:
+                f.write(orjson.dumps(self.registry, option=orjson.OPT_INDENT_2))
+        else:
+            with open(self.registry_path, 'w') as f:
+                json.dump(self.registry, f, indent=2)
+        self.dirty = False
+    
+    def clear(self):
+        """Forget every embedded document and session"""
+        self.registry["embedded_documents"] = {}
+        self.registry["statistics"]["total_documents_embedded"] = 0
+        self.registry["statistics"]["total_chunks_created"] = 0
+        self.dirty = True
+        open(self.sessions_path, 'w').close()
+    
+    def _append_session(self, session: Dict):
+        """Append a session record to the session log; the last record per session_id is current"""
+        with open(self.sessions_path, 'a') as f:
+            f.write(json.dumps(session) + "\n")
     
     def is_document_embedded(self, source_id: str, content_hash: str) -> bool:
         """Check if a document is already embedded"""
@@ -164,12 +292,32 @@ class DocumentRegistry:
             return self.registry["embedded_documents"][source_id]["content_hash"] == content_hash
         return False
     
+    def migrate_content_hash(self, source_id: str, content: str, content_hash: str) -> bool:
+        """Re-key an entry registered with the legacy truncated SHA-256 content hash, if the content is unchanged"""
+        entry = self.registry["embedded_documents"].get(source_id)
+        if entry is None or entry["content_hash"] != hashlib.sha256(content.encode()).hexdigest()[:16]:
+            return False
+        entry["content_hash"] = content_hash
+        self.dirty = True
+        return True
+    
+    def update_validators(self, source_id: str, validators: Dict[str, str]):
+        """Store the HTTP validators of an unchanged document so the next run can revalidate it with HEAD"""
+        entry = self.registry["embedded_documents"].get(source_id)
+        if entry is None or not validators:
+            return
+        metadata = entry.setdefault("metadata", {})
+        if any(metadata.get(key) != value for key, value in validators.items()):
+            metadata.update(validators)
+            self.dirty = True
+    
     def add_embedded_document(self, doc: EmbeddedDocument):
         """Add a document to the registry"""
         self.registry["embedded_documents"][doc.source_id] = asdict(doc)
         self.registry["statistics"]["total_documents_embedded"] += 1
         self.registry["statistics"]["total_chunks_created"] += doc.chunk_count
         self.registry["statistics"]["last_embedding_session"] = datetime.now().isoformat()
+        self.dirty = True
     
     def start_embedding_session(self, session_info: Dict):
         """Start a new embedding session"""
@@ -181,29 +329,137 @@ class DocumentRegistry:
             "status": "in_progress",
             **session_info
         }
-        self.registry["embedding_sessions"].append(session)
+        self.sessions[session["session_id"]] = session
+        self._append_session(session)
         return session["session_id"]
     
     def end_embedding_session(self, session_id: str, results: Dict):
         """End an embedding session"""
-        for session in self.registry["embedding_sessions"]:
-            if session["session_id"] == session_id:
-                session.update({
-                    "end_time": datetime.now().isoformat(),
-                    "status": "completed",
-                    **results
-                })
-                break
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        session.update({
+            "end_time": datetime.now().isoformat(),
+            "status": "completed",
+            **results
+        })
+        self._append_session(session)
 
 class SourceLoader:
     """Loads sources from the sources_to_embed.json file"""
     
     def __init__(self, sources_path: str = "sources_to_embed.json"):
         self.sources_path = sources_path
-        self.session = requests.Session()
+        if CachedSession is not None:
+            self.session = CachedSession(HTTP_CACHE_PATH, expire_after=86400, cache_control=True)
+        else:
+            self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'WellnessGrid-Medical-RAG/1.0 (Educational Research)'
         })
+        
+        # Enough pooled connections for every fetch thread to keep its connection alive
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Uncached session for conditional HEAD checks, which must reach the server to get a 304
+        self.validation_session = requests.Session()
+        self.validation_session.headers.update(self.session.headers)
+        self.validation_session.mount('http://', adapter)
+        self.validation_session.mount('https://', adapter)
+        
+        # ETag / Last-Modified of each fetched URL, stored in the registry for the next run
+        self.validators = {}
+        
+        # Per-host rate limiting: earliest time the next request to each host may start
+        self.host_next_request = {}
+        self.host_lock = threading.Lock()
+        
+        # Text already extracted from identical page bytes, so unchanged pages skip BeautifulSoup
+        # (shelve's dbm.sqlite3 backend on Python 3.13+ refuses use from the fetch threads, so
+        # the cache is a sqlite3 connection shared explicitly under the lock)
+        self.text_cache = sqlite3.connect(EXTRACTED_TEXT_CACHE_PATH, check_same_thread=False)
+        self.text_cache.execute("CREATE TABLE IF NOT EXISTS extracted_text (body_hash TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        self.text_cache_lock = threading.Lock()
+    
+    def close(self):
+        """Flush the extracted-text cache to disk"""
+        self.text_cache.commit()
+        self.text_cache.close()
+    
+    def wait_for_host(self, url: str):
+        """Space requests to the same host HOST_REQUEST_INTERVAL seconds apart"""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            now = time.monotonic()
+            start = max(now, self.host_next_request.get(host, now))
+            self.host_next_request[host] = start + HOST_REQUEST_INTERVAL
+        
+        if start > now:
+            time.sleep(start - now)
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET through the HTTP cache, rate-limiting only requests that reach the server"""
+        if CachedSession is not None:
+            # Fresh cached pages are answered locally, so they skip the per-host wait;
+            # requests-cache answers 504 when the page is missing or must be revalidated
+            response = self.session.get(url, only_if_cached=True, **kwargs)
+            if response.status_code != 504 and getattr(response, 'from_cache', False):
+                return response
+        
+        self.wait_for_host(url)
+        return self.session.get(url, **kwargs)
+    
+    def is_unchanged(self, url: str, validators: Dict[str, str]) -> bool:
+        """Revalidate a previously embedded URL with a conditional HEAD; True on 304 Not Modified"""
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        if not headers:
+            return False
+        
+        try:
+            self.wait_for_host(url)
+            response = self.validation_session.head(url, headers=headers, timeout=15, allow_redirects=True)
+        except requests.RequestException:
+            return False
+        return response.status_code == 304
+    
+    def fetch_if_changed(self, source: DocumentSource, entry: Optional[Dict[str, Any]]) -> Tuple[bool, Optional[str]]:
+        """(unchanged, content), skipping the fetch when an already embedded URL source is not modified"""
+        if entry is not None and source.type == 'url' and self.is_unchanged(source.url, entry.get('metadata', {})):
+            return True, None
+        return False, self.fetch_source_content(source)
+    
+    def fetch_source_content(self, source: DocumentSource) -> Optional[str]:
+        """Get a source's content based on its type"""
+        if source.type == "url" and source.url:
+            return self.fetch_url_content(source.url)
+        elif source.type == "api" and source.url:
+            return self.fetch_api_content(source)
+        elif source.type == "dataset" and source.url:
+            # For datasets, try to fetch description/readme content
+            if 'github.com' in source.url:
+                # For GitHub datasets, fetch README
+                readme_url = source.url.replace('github.com', 'raw.githubusercontent.com') + '/main/README.md'
+                content = self.fetch_url_content(readme_url)
+                if not content:
+                    readme_url = source.url.replace('github.com', 'raw.githubusercontent.com') + '/master/README.md'
+                    content = self.fetch_url_content(readme_url)
+                return content
+            else:
+                # For other datasets, fetch the main page
+                return self.fetch_url_content(source.url)
+        elif source.type == "text" and source.content:
+            return source.content
+        elif source.type == "file" and source.file_path:
+            if os.path.exists(source.file_path):
+                with open(source.file_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+        return None
     
     def load_sources(self) -> List[DocumentSource]:
         """Load all sources from the JSON file"""
@@ -256,42 +512,70 @@ class SourceLoader:
     def fetch_url_content(self, url: str) -> Optional[str]:
         """Fetch content from a URL"""
         try:
-            response = self.session.get(url, timeout=30)
+            response = self.get(url, timeout=30)
             response.raise_for_status()
+            self.validators[url] = {
+                key: value for key, value in (
+                    ('etag', response.headers.get('ETag')),
+                    ('last_modified', response.headers.get('Last-Modified'))
+                ) if value
+            }
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Same bytes as an earlier fetch: reuse the extracted text instead of re-parsing
+            body_hash = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+            with self.text_cache_lock:
+                row = self.text_cache.execute("SELECT text FROM extracted_text WHERE body_hash = ?", (body_hash,)).fetchone()
+            if row is not None:
+                return row[0]
             
-            # Remove unwanted elements
-            for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside']):
-                element.decompose()
+            text = self.extract_page_text(response.content)
             
-            # Extract main content
-            content_selectors = [
-                'main', '[role="main"]', '.main-content', '#main-content',
-                '.content', '#content', 'article', '.article'
-            ]
+            # Clean up text: strip each line once and drop the empty ones without an intermediate list
+            clean_text = '\n'.join(line for line in map(str.strip, text.splitlines()) if line)
+            
+            with self.text_cache_lock:
+                self.text_cache.execute("INSERT OR REPLACE INTO extracted_text (body_hash, text) VALUES (?, ?)", (body_hash, clean_text))
+            return clean_text
+            
+        except Exception as e:
+            print(f"❌ Failed to fetch {url}: {e}")
+            return None
+    
+    def extract_page_text(self, html: bytes) -> str:
+        """Text of the page's main content, with navigation and scripts removed"""
+        if HTMLParser is not None:
+            # lexbor parses in C, far faster than BeautifulSoup's pure-Python html.parser
+            tree = HTMLParser(html)
+            tree.strip_tags(list(UNWANTED_TAGS))
             
             main_content = None
-            for selector in content_selectors:
-                main_content = soup.select_one(selector)
+            for selector in CONTENT_SELECTORS:
+                main_content = tree.css_first(selector)
                 if main_content:
                     break
             
             if not main_content:
-                main_content = soup.find('body') or soup
-            
-            # Extract text
-            text = main_content.get_text(separator=' ', strip=True)
+                main_content = tree.body or tree.root
             
-            # Clean up text
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-            clean_text = '\n'.join(lines)
-            
-            return clean_text
-            
-        except Exception as e:
-            print(f"❌ Failed to fetch {url}: {e}")
-            return None
+            return main_content.text(separator=' ', strip=True) if main_content else ''
+        
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Remove unwanted elements
+        for element in soup(list(UNWANTED_TAGS)):
+            element.decompose()
+        
+        # Extract main content
+        main_content = None
+        for selector in COMPILED_CONTENT_SELECTORS:
+            main_content = selector.select_one(soup)
+            if main_content:
+                break
+        
+        if not main_content:
+            main_content = soup.find('body') or soup
+        
+        return main_content.get_text(separator=' ', strip=True)
     
     def fetch_api_content(self, source: DocumentSource) -> Optional[str]:
         """Fetch content from an API endpoint"""
@@ -303,7 +587,7 @@ class SourceLoader:
             if 'limit' not in params and '$limit' not in params and 'pageSize' not in params:
                 params['limit'] = '50'
             
-            response = self.session.get(url, params=params, timeout=30)
+            response = self.get(url, params=params, timeout=30)
             response.raise_for_status()
             
             # Try to parse as JSON
@@ -357,15 +641,143 @@ class SourceLoader:
         result = ''.join(content_parts) if content_parts else "No readable content found"
         return result[:5000]  # Limit total content length
 
+def format_halfvec(embedding: np.ndarray) -> str:
+    """Format a float16 embedding as pgvector text using the shortest repr of each half-precision value"""
+    return '[' + ','.join(map(str, embedding)) + ']'
+
+def load_quantized_onnx_model(SentenceTransformer):
+    """Load int8-quantized PubMedBERT on ONNX Runtime, exporting it to ONNX_MODEL_DIR on the first run"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    
+    quantized_file = os.path.join('onnx', f'model_qint8_{ONNX_QUANTIZATION}.onnx')
+    try:
+        if not os.path.exists(os.path.join(ONNX_MODEL_DIR, quantized_file)):
+            print(f"📦 Exporting int8 PubMedBERT to {ONNX_MODEL_DIR} (one-time)...")
+            exported = os.path.exists(os.path.join(ONNX_MODEL_DIR, 'onnx', 'model.onnx'))
+            model = SentenceTransformer(ONNX_MODEL_DIR if exported else EMBEDDING_MODEL_NAME, device='cpu', backend='onnx')
+            if not exported:
+                model.save(ONNX_MODEL_DIR)
+            export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, ONNX_MODEL_DIR)
+        
+        model = SentenceTransformer(
+            ONNX_MODEL_DIR,
+            device='cpu',
+            backend='onnx',
+            model_kwargs={'file_name': quantized_file}
+        )
+        print("⚡ Using int8 ONNX Runtime backend on CPU")
+        return model
+    except Exception as e:
+        print(f"⚠️ Quantized ONNX model unavailable, using PyTorch FP32: {e}")
+        return None
+
+def load_embedding_model():
+    """Load PubMedBERT in FP16 on GPU, int8 ONNX on CPU, or FP32 PyTorch as a fallback"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    
+    if torch.cuda.is_available():
+        # FP16 halves memory traffic and uses tensor cores; cosine rankings are unaffected
+        print("⚡ Using FP16 PubMedBERT on GPU")
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, device='cuda').half()
+    
+    model = load_quantized_onnx_model(SentenceTransformer) if ort is not None else None
+    return model or SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+
+def embed_worker_dir(create: bool = False) -> Optional[str]:
+    """Return EMBED_WORKER_DIR if it is a 0700 directory owned by this user, creating it if asked"""
+    if create:
+        os.makedirs(EMBED_WORKER_DIR, mode=0o700, exist_ok=True)
+    try:
+        info = os.lstat(EMBED_WORKER_DIR)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(f"{EMBED_WORKER_DIR} must be a directory owned by this user with mode 0700")
+    return EMBED_WORKER_DIR
+
+def read_embed_worker_authkey(create: bool = False) -> Optional[bytes]:
+    """Read the worker's random authkey from its 0600 file, generating it first if asked"""
+    if create:
+        try:
+            fd = os.open(EMBED_WORKER_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_bytes(32))
+    try:
+        with open(EMBED_WORKER_KEY_PATH, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+class EmbedWorkerClient:
+    """Encodes chunks in a running embed_worker.py, which keeps the model loaded between runs
+    
+    Messages are JSON and raw float16 bytes sent with send_bytes/recv_bytes, so
+    neither side ever unpickles data read from the socket.
+    """
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    @classmethod
+    def connect(cls) -> Optional['EmbedWorkerClient']:
+        """Connect to the worker at EMBED_WORKER_ADDRESS, or None when no worker is running"""
+        try:
+            if embed_worker_dir() is None or not os.path.exists(EMBED_WORKER_ADDRESS):
+                return None
+            authkey = read_embed_worker_authkey()
+            if authkey is None:
+                return None
+        except OSError as e:
+            print(f"⚠️ Embedding worker unavailable, loading the model here: {e}")
+            return None
+        
+        # Client() blocks in the auth handshake while the worker serves another run,
+        # so connect from a helper thread and give up after a bounded wait
+        result = {}
+        
+        def open_connection():
+            try:
+                result['conn'] = Client(EMBED_WORKER_ADDRESS, family='AF_UNIX', authkey=authkey)
+            except (OSError, AuthenticationError) as e:
+                result['error'] = e
+        
+        thread = threading.Thread(target=open_connection, daemon=True)
+        thread.start()
+        thread.join(EMBED_WORKER_CONNECT_TIMEOUT)
+        if 'conn' not in result:
+            reason = result.get('error', f"no answer within {EMBED_WORKER_CONNECT_TIMEOUT:.0f}s")
+            print(f"⚠️ Embedding worker unavailable, loading the model here: {reason}")
+            return None
+        print(f"🔌 Using warm embedding worker at {EMBED_WORKER_ADDRESS}")
+        return cls(result['conn'])
+    
+    def encode(self, sentences: List[str], batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Same call shape as SentenceTransformer.encode; returns float16 embeddings"""
+        request = {'chunks': sentences, 'batch_size': batch_size, 'normalize': normalize_embeddings}
+        self.conn.send_bytes(json.dumps(request).encode('utf-8'))
+        if not self.conn.poll(EMBED_WORKER_RECV_TIMEOUT):
+            raise TimeoutError(f"embedding worker did not answer within {EMBED_WORKER_RECV_TIMEOUT:.0f}s")
+        header = json.loads(self.conn.recv_bytes())
+        if header.get('status') != 'ok':
+            raise RuntimeError(f"embedding worker failed: {header.get('error')}")
+        payload = self.conn.recv_bytes()
+        return np.frombuffer(payload, dtype=np.float16).reshape(len(sentences), -1)
+
 class DocumentEmbedder:
     """Handles document embedding with Supabase"""
     
     def __init__(self):
         # Import here to avoid issues if packages aren't installed
-        from sentence_transformers import SentenceTransformer
         from supabase import create_client
         
-        self.embedding_model = SentenceTransformer('NeuML/pubmedbert-base-embeddings')
+        # A running embed_worker.py already has the model loaded; otherwise load it in-process
+        self.embedding_model = EmbedWorkerClient.connect() or load_embedding_model()
+        self.embedding_cache = {}
+        self.load_embedding_cache()
         print("🧠 Embedding model: PubMedBERT (medical-specific)")
         print("   - Optimized for biomedical text")
         print("   - 768-dimensional embeddings")
@@ -375,30 +787,58 @@ class DocumentEmbedder:
         supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
         self.supabase = create_client(supabase_url, supabase_key)
         
+        # Postgres connection string (not the REST endpoint) for COPY-based embedding loads
+        self.db_url = os.getenv('SUPABASE_DB_URL')
+        if self.db_url and psycopg is not None:
+            print("⚡ Documents and embeddings will be loaded in one transaction over SUPABASE_DB_URL")
+        
         print("✅ Embedding model and database connection initialized")
     
+    @staticmethod
+    def embedding_key(chunk: str) -> bytes:
+        """Hash of the chunk text, keyed by model so vectors from another model are never reused"""
+        return hashlib.blake2b(chunk.encode('utf-8'), digest_size=16, key=EMBEDDING_MODEL_NAME.encode()).digest()
+    
+    def load_embedding_cache(self):
+        """Load chunk embeddings saved by earlier runs from EMBEDDING_CACHE_PATH"""
+        if not os.path.exists(EMBEDDING_CACHE_PATH):
+            return
+        
+        try:
+            with np.load(EMBEDDING_CACHE_PATH) as data:
+                self.embedding_cache = {key.tobytes(): embedding for key, embedding in zip(data['keys'], data['embeddings'])}
+            print(f"💾 Loaded {len(self.embedding_cache)} cached chunk embeddings")
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable embedding cache: {e}")
+    
+    def save_embedding_cache(self):
+        """Persist the chunk embedding cache to EMBEDDING_CACHE_PATH for the next run"""
+        if not self.embedding_cache:
+            return
+        
+        keys = np.frombuffer(b''.join(self.embedding_cache), dtype=np.uint8).reshape(-1, 16)
+        embeddings = np.stack(list(self.embedding_cache.values()))
+        np.savez(EMBEDDING_CACHE_PATH, keys=keys, embeddings=embeddings)
+    
     def clear_database(self):
         """Clear all embedded documents from the database"""
         print("🗑️ Clearing database...")
         
+        from postgrest.types import ReturnMethod
+        
         try:
-            # Get all records first, then delete them
-            embeddings = self.supabase.table('document_embeddings').select('id').execute()
-            if embeddings.data:
-                for record in embeddings.data:
-                    self.supabase.table('document_embeddings').delete().eq('id', record['id']).execute()
-                print(f"✅ Cleared {len(embeddings.data)} embeddings")
-            else:
-                print("✅ No embeddings to clear")
+            # One bulk DELETE per table instead of a request per row; PostgREST rejects an
+            # unfiltered DELETE, so match every id. Only the count comes back, not the rows.
+            embeddings = self.supabase.table('document_embeddings').delete(
+                count='exact', returning=ReturnMethod.minimal
+            ).neq('id', NIL_UUID).execute()
+            print(f"✅ Cleared {embeddings.count or 0} embeddings")
             
             # Clear documents table
-            documents = self.supabase.table('medical_documents').select('id').execute()
-            if documents.data:
-                for record in documents.data:
-                    self.supabase.table('medical_documents').delete().eq('id', record['id']).execute()
-                print(f"✅ Cleared {len(documents.data)} documents")
-            else:
-                print("✅ No documents to clear")
+            documents = self.supabase.table('medical_documents').delete(
+                count='exact', returning=ReturnMethod.minimal
+            ).neq('id', NIL_UUID).execute()
+            print(f"✅ Cleared {documents.count or 0} documents")
             
             print("✅ Database cleared successfully")
             
@@ -408,124 +848,264 @@ class DocumentEmbedder:
     
     def generate_content_hash(self, content: str) -> str:
         """Generate a hash for content to detect changes"""
-        return hashlib.sha256(content.encode()).hexdigest()[:16]
+        # 64-bit BLAKE2b keeps the 16-character hex format and hashes faster than SHA-256
+        return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
     
-    def chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        """Split text into chunks for embedding"""
+    def iter_chunks(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> Iterator[str]:
+        """Yield the chunks of text to embed, one at a time"""
         if len(text) <= chunk_size:
-            return [text]
+            yield text
+            return
         
-        chunks = []
         start = 0
         
+        # Offsets of every sentence ending, found in one vectorized scan (UTF-32 keeps one code unit per character;
+        # surrogatepass keeps lone surrogates from API JSON encodable)
+        codepoints = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        sentence_ends = np.flatnonzero(np.isin(codepoints, SENTENCE_END_CODEPOINTS))
+        window = min(overlap, chunk_size // 4)
+        
         while start < len(text):
             end = start + chunk_size
             
             # Try to break at sentence boundaries
             if end < len(text):
-                # Look for sentence endings within the overlap region
-                for i in range(min(overlap, chunk_size // 4)):
-                    if text[end - i:end - i + 1] in '.!?':
-                        end = end - i + 1
-                        break
+                # Last sentence ending within the overlap region before the boundary
+                idx = np.searchsorted(sentence_ends, end, side='right') - 1
+                if idx >= 0 and sentence_ends[idx] > end - window:
+                    end = int(sentence_ends[idx]) + 1
             
             chunk = text[start:end].strip()
             if chunk:
-                chunks.append(chunk)
+                yield chunk
             
             start = end - overlap
             if start >= len(text):
                 break
-        
-        return chunks
     
-    def embed_document(self, source: DocumentSource, content: str, registry: DocumentRegistry, force: bool = False) -> bool:
-        """Embed a single document"""
-        source_id = f"{source.category}_{source.subcategory}_{hashlib.sha256(source.title.encode()).hexdigest()[:8]}"
+    def prepare_document(self, source: DocumentSource, content: str, registry: DocumentRegistry, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Build the document record and chunk its content; records are inserted and embedded later for all documents at once"""
+        source_id = source.source_id
         content_hash = self.generate_content_hash(content)
         
         # Check if already embedded
-        if not force and registry.is_document_embedded(source_id, content_hash):
+        if not force and (registry.is_document_embedded(source_id, content_hash)
+                          or registry.migrate_content_hash(source_id, content, content_hash)):
             print(f"⏭️ Skipping {source.title} (already embedded)")
-            return False
+            return None
         
-        print(f"🔄 Embedding: {source.title}")
+        print(f"🔄 Preparing: {source.title}")
         
-        try:
-            # Insert document record
-            doc_data = {
-                'title': source.title,
-                'content': content,
-                'source': f"{source.category}_{source.type}",
-                'topic': source.subcategory,
-                'url': source.url,
-                'document_type': source.type,
-                'metadata': {
-                    'source_id': source_id,
-                    'content_hash': content_hash,
-                    'description': source.description,
-                    'priority': source.priority,
-                    'category': source.category,
-                    'subcategory': source.subcategory,
-                    'embedding_date': datetime.now().isoformat()
-                },
-                'content_length': len(content)
-            }
-            
-            doc_result = self.supabase.table('medical_documents').insert(doc_data).execute()
-            doc_id = doc_result.data[0]['id']
-            
-            # Chunk the content
-            chunks = self.chunk_text(content)
-            print(f"  📄 Created {len(chunks)} chunks")
-            
-            # Generate embeddings for chunks
-            embeddings = self.embedding_model.encode(chunks)
-            
-            # Insert embeddings
-            embedding_data = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                embedding_data.append({
-                    'document_id': doc_id,
-                    'chunk_index': i,
-                    'chunk_content': chunk,
-                    'embedding': embedding.tolist()
-                })
-            
-            # Batch insert embeddings
-            self.supabase.table('document_embeddings').insert(embedding_data).execute()
-            
-            # Update registry
-            embedded_doc = EmbeddedDocument(
-                source_id=source_id,
-                title=source.title,
-                content_hash=content_hash,
-                embedding_date=datetime.now().isoformat(),
-                chunk_count=len(chunks),
-                category=source.category,
-                subcategory=source.subcategory,
-                source_type=source.type,
-                metadata={
-                    'description': source.description,
-                    'priority': source.priority,
-                    'url': source.url,
-                    'document_id': doc_id
-                }
-            )
+        doc_data = {
+            'title': source.title,
+            'content': content,
+            'source': f"{source.category}_{source.type}",
+            'topic': source.subcategory,
+            'url': source.url,
+            'document_type': source.type,
+            'metadata': {
+                'source_id': source_id,
+                'content_hash': content_hash,
+                'description': source.description,
+                'priority': source.priority,
+                'category': source.category,
+                'subcategory': source.subcategory,
+                'embedding_date': datetime.now().isoformat()
+            },
+            'content_length': len(content)
+        }
+        
+        # Chunks are kept because the chunk text is both encoded and stored with its embedding
+        chunks = list(self.iter_chunks(content))
+        print(f"  📄 Created {len(chunks)} chunks")
+        
+        return {
+            'source': source,
+            'source_id': source_id,
+            'content_hash': content_hash,
+            'doc_data': doc_data,
+            'chunks': chunks
+        }
+    
+    def insert_documents(self, pending: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert the records of all prepared documents in batches and attach each server-assigned id"""
+        from postgrest.types import ReturnMethod
+        
+        inserted = []
+        for start in range(0, len(pending), DOCUMENT_INSERT_BATCH):
+            batch = pending[start:start + DOCUMENT_INSERT_BATCH]
+            rows = [doc.pop('doc_data') for doc in batch]
+            try:
+                result = self.supabase.table('medical_documents').insert(
+                    rows, returning=ReturnMethod.representation
+                ).execute()
+            except Exception as e:
+                print(f"  ❌ Failed to insert {len(batch)} documents: {e}")
+                continue
             
-            registry.add_embedded_document(embedded_doc)
-            print(f"  ✅ Embedded successfully")
-            return True
+            # Rows come back in request order
+            for doc, row in zip(batch, result.data):
+                doc['doc_id'] = row['id']
+                inserted.append(doc)
+        
+        print(f"📄 Inserted {len(inserted)} document records")
+        return inserted
+    
+    def encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Encode chunks to float16, loading the model here if the embedding worker fails"""
+        encode_kwargs = {
+            'batch_size': 256,
+            'show_progress_bar': True,
+            'convert_to_numpy': True,
+            'normalize_embeddings': False
+        }
+        if isinstance(self.embedding_model, EmbedWorkerClient):
+            try:
+                return self.embedding_model.encode(chunks, **encode_kwargs)
+            except (EOFError, OSError, RuntimeError, ValueError) as e:
+                # The prepared documents still need their embeddings, so encode them here instead
+                print(f"⚠️ Embedding worker failed, loading the model here: {e}")
+                self.embedding_model = load_embedding_model()
+        
+        # float16 matches the halfvec column and halves the text sent per vector
+        return self.embedding_model.encode(chunks, **encode_kwargs).astype(np.float16)
+    
+    def embed_documents(self, pending: List[Dict[str, Any]], registry: DocumentRegistry) -> int:
+        """Embed the chunks of all prepared documents in one encode() call, then store documents and embeddings"""
+        # Boilerplate shared across sources (disclaimers, headers) and chunks embedded by
+        # earlier runs are only encoded once
+        keys = []
+        uncached = {}
+        for doc in pending:
+            for chunk in doc['chunks']:
+                key = self.embedding_key(chunk)
+                keys.append(key)
+                if key not in self.embedding_cache:
+                    uncached.setdefault(key, chunk)
+        if not keys:
+            return 0
+        
+        # One large call keeps the model busy across short documents; encode() sorts chunks
+        # by length so each mini-batch pads only to its own longest chunk
+        print(f"🧠 Embedding {len(uncached)} new unique chunks of {len(keys)} from {len(pending)} documents...")
+        if uncached:
+            new_embeddings = self.encode_chunks(list(uncached.values()))
+            self.embedding_cache.update(zip(uncached, new_embeddings))
+            self.save_embedding_cache()
+        
+        embeddings = np.stack([self.embedding_cache[key] for key in keys])
+        
+        # Slice the flat embedding array back into per-document runs
+        offset = 0
+        for doc in pending:
+            doc['embeddings'] = embeddings[offset:offset + len(doc['chunks'])]
+            offset += len(doc['chunks'])
+        
+        if self.db_url and psycopg is not None:
+            return self.copy_documents_and_embeddings(pending, registry)
+        
+        # REST fallback: documents whose embeddings fail are deleted again, so the next run
+        # re-inserts them instead of leaving duplicates without embeddings
+        pending = self.insert_documents(pending)
+        embedded = 0
+        failed_ids = []
+        for doc in pending:
+            try:
+                # Insert embeddings
+                embedding_data = []
+                for i, (chunk, embedding) in enumerate(zip(doc['chunks'], doc['embeddings'])):
+                    embedding_data.append({
+                        'document_id': doc['doc_id'],
+                        'chunk_index': i,
+                        'chunk_content': chunk,
+                        'embedding': format_halfvec(embedding)
+                    })
+                
+                # Batch insert embeddings
+                self.supabase.table('document_embeddings').insert(embedding_data).execute()
+                
+                self.register_embedded_document(doc, registry)
+                embedded += 1
+                
+            except Exception as e:
+                print(f"  ❌ Failed to embed {doc['source'].title}: {e}")
+                failed_ids.append(doc['doc_id'])
+        
+        if failed_ids:
+            try:
+                self.supabase.table('medical_documents').delete().in_('id', failed_ids).execute()
+            except Exception as e:
+                print(f"  ⚠️ Could not remove {len(failed_ids)} documents without embeddings: {e}")
+        
+        return embedded
+    
+    def copy_documents_and_embeddings(self, pending: List[Dict[str, Any]], registry: DocumentRegistry) -> int:
+        """Insert all prepared documents and COPY their embeddings in one transaction over a direct Postgres connection"""
+        try:
+            # The connection block commits on success and rolls back on any error, so a failed
+            # COPY leaves no document rows behind without embeddings
+            with psycopg.connect(self.db_url) as conn:
+                with conn.cursor() as cur:
+                    for start in range(0, len(pending), DOCUMENT_INSERT_BATCH):
+                        batch = pending[start:start + DOCUMENT_INSERT_BATCH]
+                        rows = []
+                        for doc in batch:
+                            data = doc.pop('doc_data')
+                            rows.append((
+                                data['title'], data['content'], data['source'], data['topic'], data['url'],
+                                data['document_type'], Json(data['metadata']), data['content_length']
+                            ))
+                        cur.executemany(DOCUMENT_INSERT_SQL, rows, returning=True)
+                        # One result set per row, in request order
+                        for doc in batch:
+                            doc['doc_id'] = str(cur.fetchone()[0])
+                            cur.nextset()
+                    
+                    # COPY streams rows without per-row query parsing or JSON encoding of the vectors
+                    with cur.copy(EMBEDDING_COPY_SQL) as copy:
+                        for doc in pending:
+                            for i, (chunk, embedding) in enumerate(zip(doc['chunks'], doc['embeddings'])):
+                                copy.write_row((doc['doc_id'], i, chunk, format_halfvec(embedding)))
             
         except Exception as e:
-            print(f"  ❌ Failed to embed: {e}")
-            return False
+            print(f"  ❌ Failed to store documents and embeddings: {e}")
+            return 0
+        
+        print(f"📄 Inserted {len(pending)} document records")
+        for doc in pending:
+            self.register_embedded_document(doc, registry)
+        return len(pending)
+    
+    def register_embedded_document(self, doc: Dict[str, Any], registry: DocumentRegistry):
+        """Record a document whose embeddings were stored"""
+        source = doc['source']
+        embedded_doc = EmbeddedDocument(
+            source_id=doc['source_id'],
+            title=source.title,
+            content_hash=doc['content_hash'],
+            embedding_date=datetime.now().isoformat(),
+            chunk_count=len(doc['chunks']),
+            category=source.category,
+            subcategory=source.subcategory,
+            source_type=source.type,
+            metadata={
+                'description': source.description,
+                'priority': source.priority,
+                'url': source.url,
+                'document_id': doc['doc_id'],
+                **doc.get('validators', {})
+            }
+        )
+        
+        registry.add_embedded_document(embedded_doc)
+        print(f"  ✅ Embedded: {source.title}")
 
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(description='WellnessGrid Document Embedding System')
     parser.add_argument('--clear-db', action='store_true', help='Clear database before embedding')
     parser.add_argument('--force', action='store_true', help='Re-embed all documents')
+    parser.add_argument('--bootstrap', action='store_true', help='Install required packages before running')
     args = parser.parse_args()
     
     print("🚀 WellnessGrid Document Embedding System")
@@ -536,8 +1116,9 @@ def main():
         print("❌ Environment setup failed")
         return
     
-    # Install packages
-    install_packages()
+    # --bootstrap already installed packages at import time; pip on every run costs seconds even when nothing changes
+    if not args.bootstrap and not check_packages():
+        return
     
     # Initialize components
     registry = DocumentRegistry()
@@ -548,10 +1129,7 @@ def main():
     if args.clear_db:
         embedder.clear_database()
         # Clear registry as well
-        registry.registry["embedded_documents"] = {}
-        registry.registry["embedding_sessions"] = []
-        registry.registry["statistics"]["total_documents_embedded"] = 0
-        registry.registry["statistics"]["total_chunks_created"] = 0
+        registry.clear()
         registry.save_registry()
         print("✅ Registry cleared")
     
@@ -570,45 +1148,44 @@ def main():
     
     print(f"📝 Started embedding session: {session_id}")
     
-    # Process sources
+    # Phase 1: fetch, chunk and register each source
     processed = 0
-    embedded = 0
+    pending = []
     
-    for source in tqdm(sources, desc="Processing sources"):
-        # Get content based on source type
-        content = None
+    # Already embedded URL sources are revalidated with a cheap HEAD before any full fetch
+    embedded_documents = {} if args.force else registry.registry["embedded_documents"]
+    
+    # Fetches run concurrently; the loader rate-limits per host, so one slow API does not stall the rest
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = {
+            executor.submit(loader.fetch_if_changed, source, embedded_documents.get(source.source_id)): source
+            for source in sources
+        }
         
-        if source.type == "url" and source.url:
-            content = loader.fetch_url_content(source.url)
-        elif source.type == "api" and source.url:
-            content = loader.fetch_api_content(source)
-        elif source.type == "dataset" and source.url:
-            # For datasets, try to fetch description/readme content
-            if 'github.com' in source.url:
-                # For GitHub datasets, fetch README
-                readme_url = source.url.replace('github.com', 'raw.githubusercontent.com') + '/main/README.md'
-                content = loader.fetch_url_content(readme_url)
-                if not content:
-                    readme_url = source.url.replace('github.com', 'raw.githubusercontent.com') + '/master/README.md'
-                    content = loader.fetch_url_content(readme_url)
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing sources"):
+            source = futures[future]
+            unchanged, content = future.result()
+            
+            if unchanged:
+                print(f"⏭️ Skipping {source.title} (not modified since last embedding)")
+                processed += 1
+            elif content and len(content.strip()) > 50:  # Ensure minimum content length
+                prepared = embedder.prepare_document(source, content, registry, args.force)
+                validators = loader.validators.get(source.url, {})
+                if prepared:
+                    prepared['validators'] = validators
+                    pending.append(prepared)
+                else:
+                    # Same content behind a new ETag: remember it so the next run can skip the fetch
+                    registry.update_validators(source.source_id, validators)
+                processed += 1
             else:
-                # For other datasets, fetch the main page
-                content = loader.fetch_url_content(source.url)
-        elif source.type == "text" and source.content:
-            content = source.content
-        elif source.type == "file" and source.file_path:
-            if os.path.exists(source.file_path):
-                with open(source.file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-        
-        if content and len(content.strip()) > 50:  # Ensure minimum content length
-            if embedder.embed_document(source, content, registry, args.force):
-                embedded += 1
-            processed += 1
-        else:
-            print(f"⚠️ No content found for: {source.title}")
-        
-        time.sleep(2)  # Rate limiting for APIs
+                print(f"⚠️ No content found for: {source.title}")
+    
+    loader.close()
+    
+    # Phase 2: embed every pending chunk together, then store the documents with their embeddings
+    embedded = embedder.embed_documents(pending, registry)
     
     # End session
     registry.end_embedding_session(session_id, {
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+WellnessGrid Embedding Worker
+
+Keeps PubMedBERT loaded between runs of embed_documents.py, so frequent
+re-embedding does not pay the torch import and model load on every run.
+embed_documents.py uses the worker automatically while it is running and
+loads the model itself otherwise.
+
+Usage:
+    python embed_worker.py    # Serve on EMBED_WORKER_ADDRESS until interrupted
+
+The socket and a random authkey file sit in a per-user 0700 directory
+($XDG_RUNTIME_DIR or the temp dir), and requests are JSON rather than pickles.
+"""
+
+import os
+import json
+import stat
+import numpy as np
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from embed_documents import EMBED_WORKER_ADDRESS, embed_worker_dir, load_embedding_model, read_embed_worker_authkey
+
+def serve(model, authkey: bytes):
+    """Answer encode requests, one client connection at a time"""
+    with Listener(EMBED_WORKER_ADDRESS, family='AF_UNIX', authkey=authkey) as listener:
+        print(f"🔌 Embedding worker listening on {EMBED_WORKER_ADDRESS}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError) as e:
+                print(f"⚠️ Rejected connection: {e}")
+                continue
+            
+            with conn:
+                while True:
+                    try:
+                        request = json.loads(conn.recv_bytes())
+                    except EOFError:
+                        break
+                    except ValueError as e:
+                        conn.send_bytes(json.dumps({'status': 'error', 'error': f"malformed request: {e}"}).encode('utf-8'))
+                        continue
+                    
+                    try:
+                        embeddings = model.encode(
+                            request['chunks'],
+                            batch_size=request['batch_size'],
+                            show_progress_bar=True,
+                            convert_to_numpy=True,
+                            normalize_embeddings=request['normalize']
+                        )
+                    except Exception as e:
+                        # A bad request fails only that request; the worker keeps serving
+                        print(f"❌ Encode failed: {e}")
+                        conn.send_bytes(json.dumps({'status': 'error', 'error': str(e)}).encode('utf-8'))
+                        continue
+                    
+                    # float16 halves the bytes sent back and matches the halfvec column
+                    conn.send_bytes(b'{"status": "ok"}')
+                    conn.send_bytes(np.ascontiguousarray(embeddings, dtype=np.float16).tobytes())
+            print("✅ Client finished")
+
+def main():
+    """Load the model once and serve until interrupted"""
+    print("🚀 WellnessGrid Embedding Worker")
+    print("=" * 50)
+    
+    embed_worker_dir(create=True)
+    authkey = read_embed_worker_authkey(create=True)
+    
+    if os.path.lexists(EMBED_WORKER_ADDRESS):
+        if not stat.S_ISSOCK(os.lstat(EMBED_WORKER_ADDRESS).st_mode):
+            print(f"❌ {EMBED_WORKER_ADDRESS} exists and is not a socket; remove it manually")
+            return
+        try:
+            Client(EMBED_WORKER_ADDRESS, family='AF_UNIX', authkey=authkey).close()
+            print(f"⚠️ An embedding worker is already running on {EMBED_WORKER_ADDRESS}")
+            return
+        except (OSError, AuthenticationError):
+            # A socket left behind by a worker that did not shut down cleanly blocks bind()
+            os.remove(EMBED_WORKER_ADDRESS)
+    
+    model = load_embedding_model()
+    print("🧠 PubMedBERT loaded")
+    
+    try:
+        serve(model, authkey)
+    except KeyboardInterrupt:
+        print("\n👋 Embedding worker stopped")
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ Efficiently processes scraped documents and creates real medical embeddings
 
 import json
 import os
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 import time
 
@@ -29,6 +30,17 @@ def create_medical_embeddings(text_chunks, model):
     embeddings = model.encode(text_chunks, show_progress_bar=True)
     return embeddings
 
+@lru_cache(maxsize=4)
+def vector_format(dimensions):
+    """Build a printf-style template for a pgvector literal of the given size"""
+    # %.9g round-trips float32 exactly, which is what pgvector stores
+    return '[' + ','.join(['%.9g'] * dimensions) + ']'
+
+def format_vector(embedding):
+    """Render an embedding as a pgvector literal with a single C-level % format"""
+    values = embedding.tolist()
+    return vector_format(len(values)) % tuple(values)
+
 def chunk_text(text, chunk_size=1000, overlap=100):
     """Split text into overlapping chunks"""
     if len(text) <= chunk_size:
@@ -98,7 +110,7 @@ VALUES (
             # Generate embedding SQL statements
             for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
                 chunk_clean = chunk.replace("'", "''").replace("\\", "\\\\")
-                embedding_vector = '[' + ','.join(map(str, embedding.tolist())) + ']'
+                embedding_vector = format_vector(embedding)
                 
                 emb_sql = f"""
 INSERT INTO document_embeddings (document_id, chunk_index, chunk_content, embedding)
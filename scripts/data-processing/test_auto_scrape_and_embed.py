@@ -0,0 +1,37 @@
+"""Tests for the chunking helpers in auto_scrape_and_embed.py (run with: python -m pytest scripts/data-processing)"""
+
+import json
+
+import pytest
+
+# The module exits on import when its embedding dependencies are missing
+for module in ('numpy', 'torch', 'sentence_transformers', 'ijson', 'psycopg', 'pgvector', 'tqdm'):
+    pytest.importorskip(module)
+
+from auto_scrape_and_embed import AutoScrapingEmbeddingPipeline
+
+def reference_chunks(text, chunk_size, overlap):
+    """The original rfind-based chunker the vectorized scan must match"""
+    if len(text) <= chunk_size:
+        return [text]
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            sentence_end = text.rfind('.', start + chunk_size - 200, end)
+            if sentence_end > start:
+                end = sentence_end + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end - overlap
+        if start >= len(text):
+            break
+    return chunks
+
+def test_create_text_chunks_accepts_lone_surrogates():
+    # json.loads yields lone surrogates from escapes such as "\ud800" in scraped data
+    text = json.loads('"' + 'Sentence with a lone \\ud800 surrogate. ' * 60 + '"')
+    chunks = AutoScrapingEmbeddingPipeline.create_text_chunks(None, text, 500, 50)
+    assert chunks == reference_chunks(text, 500, 50)
@@ -29,6 +29,12 @@ except ImportError:
     print("pip install beautifulsoup4 feedparser aiohttp lxml requests")
     exit(1)
 
+# Optional orjson for writing the (large) scrape output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -700,8 +706,12 @@ class EnhancedMedicalScraper:
             'documents': documents
         }
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
         
         logger.info(f"💾 Documents saved to: {filename}")
         logger.info(f"📊 Total saved: {len(documents)} documents")